@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Measure how much CPU an idle Screen uses.
+
+    python benchmarks/idle_cpu.py [--seconds N]
+
+Runs Screen frames for a while with a terminal that has nothing to
+show (a shell sitting at its prompt), first composing every frame
+(idle_wait = None, like before Screen could skip frames) and then the
+default way, and reports CPU time used per second of each.
+
+It uses a hidden raylib window. If there is no display it runs itself
+under xvfb-run, so it works unattended on a headless box.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+def measure(screen, seconds):
+    """CPU seconds used per second while running frames for seconds."""
+    cpu = time.process_time()
+    start = time.perf_counter()
+    frames = 0
+    while time.perf_counter() - start < seconds:
+        screen.frame()
+        frames += 1
+    elapsed = time.perf_counter() - start
+    return (time.process_time() - cpu) / elapsed, frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY"):
+        os.execvp("xvfb-run", ["xvfb-run", "-a", sys.executable] + sys.argv)
+
+    # Import late, raylib needs to find a display
+    from cobra_py import rl
+    from cobra_py.terminal import Terminal
+
+    rl.set_trace_log_level(rl.LOG_WARNING)
+    rl.set_config_flags(rl.FLAG_WINDOW_HIDDEN)
+    screen = rl.Screen(1024, 768)
+    Terminal(screen, cmd="sh")
+    # Let the shell print its prompt
+    deadline = time.perf_counter() + 1
+    while time.perf_counter() < deadline:
+        screen.frame()
+
+    idle_wait = screen.idle_wait
+    for name, wait in (("always composing", None), ("skipping frames", idle_wait)):
+        screen.idle_wait = wait
+        usage, fps = measure(screen, args.seconds)
+        print(f"{name:>16}: {usage * 100:5.1f}% CPU, {fps:6.1f} frames/s")
+    rl.close_window()
+
+
+if __name__ == "__main__":
+    main()
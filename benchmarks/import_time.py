@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Check that importing cobra_py.rl stays within its time budget.
+
+    python benchmarks/import_time.py [--runs N]
+
+Imports it in a fresh interpreter with python -X importtime a few
+times, and takes the best of cobra_py.rl's own import time, which
+doesn't count the modules it imports. Exits with an error if that's
+over BUDGET_MS, see the docstring of cobra_py/rl.py.
+"""
+
+import argparse
+import subprocess
+import sys
+
+BUDGET_MS = 5
+
+
+def own_import_time(module):
+    """Import module in a new interpreter, return its own import time in ms."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time:       123 |       4567 |   cobra_py.rl"
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[0].split(":")[1]) / 1000
+    raise RuntimeError(f"No import time for {module} in:\n{result.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    best = min(own_import_time("cobra_py.rl") for _ in range(args.runs))
+    print(f"cobra_py.rl imports in {best:.2f}ms, budget is {BUDGET_MS}ms")
+    if best > BUDGET_MS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
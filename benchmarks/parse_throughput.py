@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Measure how fast pty output is parsed, with and without the ASCII fast path.
+
+    python benchmarks/parse_throughput.py [trace ...]
+
+Uses the recorded traces, see traces.py. Doesn't need raylib or a display.
+"""
+
+import sys
+import time
+
+import pyte
+import traces
+
+from cobra_py.fast_screen import FastScreen
+
+
+def throughput(data, fast_path):
+    screen = FastScreen(traces.COLUMNS, traces.LINES)
+    screen.ascii_fast_path = fast_path
+    stream = pyte.ByteStream(screen)
+    view = memoryview(data)
+    t1 = time.perf_counter()
+    while view:
+        stream.feed(view[:16384])
+        view = view[16384:]
+    return len(data) / (time.perf_counter() - t1) / (1 << 20)
+
+
+def main():
+    for name, data in traces.load(sys.argv[1:]):
+        before = throughput(data, False)
+        after = throughput(data, True)
+        print(
+            f"{name:>12} ({len(data) / (1 << 20):4.1f}MB): without"
+            f" {before:5.2f}MB/s, fast path {after:5.2f}MB/s ({after / before:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Time searches over a large scrollback.
+
+Fills a Scrollback with 100k lines of compiler-looking output and times
+a few queries. Doesn't need raylib or a display.
+"""
+
+import random
+import time
+
+import pyte
+
+from cobra_py.scrollback import Scrollback
+
+LINES = 100_000
+WORDS = (
+    "gcc warning error foo.c bar.h undefined reference to linking "
+    "compile object main int unused variable note in function"
+).split()
+
+
+def main():
+    random.seed(42)
+    screen = pyte.Screen(120, 1)
+    stream = pyte.Stream(screen)
+    history = Scrollback(max_bytes=1 << 30)
+    t1 = time.perf_counter()
+    for i in range(LINES):
+        line = " ".join(random.choice(WORDS) for _ in range(10))
+        stream.feed(f"\r\x1b[K{line} {i}")
+        history.push(screen.buffer[0], screen.columns)
+    print(
+        f"Stored {len(history)} lines in {time.perf_counter() - t1:.1f}s, "
+        f"{history.nbytes / (1 << 20):.1f}MB"
+    )
+
+    for query in ("undefined reference to main", "NOTE IN", "99999", "not there"):
+        times = []
+        for _ in range(10):
+            t1 = time.perf_counter()
+            matches = list(history.search(query))
+            times.append(time.perf_counter() - t1)
+        print(
+            f"{query!r:>30}: {len(matches):6} matches, "
+            f"best {min(times) * 1000:6.2f}ms, worst {max(times) * 1000:6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
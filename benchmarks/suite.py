@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Replay recorded pty traces through Terminal and report how it went.
+
+    python benchmarks/suite.py [--frame-bytes N] [--json FILE] [trace ...]
+
+Each trace (see traces.py) is fed to a Terminal a few KB per frame,
+rendering after each one, like Terminal.update does with a program
+that is writing as fast as it can. For each trace it reports how fast
+it was parsed, how many cells were drawn, and frame time percentiles.
+
+It uses a hidden raylib window. If there is no display it runs itself
+under xvfb-run, so it works unattended on a headless box.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import traces
+
+
+def replay(term, data, frame_bytes):
+    parse_time = 0.0
+    frame_times = []
+    cells_drawn = 0
+    view = memoryview(data)
+    while view:
+        t1 = time.perf_counter()
+        term.stream.feed(view[:frame_bytes])
+        t2 = time.perf_counter()
+        term.render()
+        t3 = time.perf_counter()
+        parse_time += t2 - t1
+        frame_times.append(t3 - t1)
+        cells_drawn += term.cells_drawn
+        view = view[frame_bytes:]
+
+    percentiles = statistics.quantiles(frame_times, n=100)
+    return {
+        "bytes": len(data),
+        "frames": len(frame_times),
+        "parse_mb_s": len(data) / parse_time / (1 << 20),
+        "cells_drawn": cells_drawn,
+        "cells_drawn_per_frame": cells_drawn / len(frame_times),
+        "frame_ms_p50": percentiles[49] * 1000,
+        "frame_ms_p95": percentiles[94] * 1000,
+        "frame_ms_p99": percentiles[98] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("traces", nargs="*", help="trace names, default is all")
+    parser.add_argument("--frame-bytes", type=int, default=8192)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if not os.environ.get("DISPLAY"):
+        os.execvp("xvfb-run", ["xvfb-run", "-a", sys.executable] + sys.argv)
+
+    # Import late, raylib needs to find a display
+    from cobra_py import rl
+    from cobra_py.terminal import Terminal
+
+    rl.set_trace_log_level(rl.LOG_WARNING)
+    rl.set_config_flags(rl.FLAG_WINDOW_HIDDEN)
+    # Big enough for the terminal size the traces were recorded with
+    screen = rl.Screen(1600, 1000)
+
+    results = {}
+    for name, data in traces.load(args.traces):
+        # A fresh terminal for each trace, same size as when recorded
+        term = Terminal(screen, cmd=None)
+        term.resize(traces.LINES, traces.COLUMNS)
+        term.invalidate()
+        result = results[name] = replay(term, data, args.frame_bytes)
+        print(
+            f"{name:>12}: {result['parse_mb_s']:6.2f}MB/s parsed, "
+            f"{result['cells_drawn_per_frame']:7.1f} cells drawn/frame, "
+            f"frame p50 {result['frame_ms_p50']:6.2f}ms "
+            f"p95 {result['frame_ms_p95']:6.2f}ms "
+            f"p99 {result['frame_ms_p99']:6.2f}ms"
+        )
+        screen.layers.remove(term)
+        term.unload_texture()
+
+    if args.json:
+        with open(args.json, "w") as outf:
+            json.dump(results, outf, indent=2)
+    rl.close_window()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Compare per-cell and run-coalesced drawing in Terminal.
+
+For a full-screen redraw of colored output, reports how many raylib
+draw calls go through the FFI and how long each frame takes.
+
+Needs a X server, but not a physical display, so this works:
+
+    xvfb-run python benchmarks/terminal_draw.py
+"""
+
+import statistics
+import time
+from collections import Counter
+
+from cobra_py import rl
+from cobra_py.terminal import Terminal
+
+FRAMES = 100
+
+# Something that looks like `ls --color` output
+WORDS = [
+    b"\x1b[01;34mbuild\x1b[0m",
+    b"README.md",
+    b"\x1b[01;32mrun.sh\x1b[0m",
+    b"\x1b[01;31mdist.tar.gz\x1b[0m",
+    b"setup.py",
+    b"\x1b[01;36mlatest\x1b[0m",
+    b"\x1b[30;42mtmp\x1b[0m",
+]
+
+
+def colored_screen(rows, columns):
+    lines = []
+    for y in range(rows):
+        line = []
+        width = 0
+        i = y
+        while True:
+            word = WORDS[i % len(WORDS)]
+            i += 1
+            # Rough visible width, escapes don't count
+            visible = len(word.split(b"m", 1)[-1].split(b"\x1b")[0]) + 2
+            if width + visible >= columns:
+                break
+            line.append(word)
+            width += visible
+        lines.append(b"  ".join(line))
+    return b"\r\n".join(lines)
+
+
+def count_calls(counter, name, f):
+    def counted(*a):
+        counter[name] += 1
+        return f(*a)
+
+    return counted
+
+
+def measure(term, coalesce_runs):
+    term.coalesce_runs = coalesce_runs
+    calls = Counter()
+    real = {name: getattr(rl, name) for name in ("draw_rectangle", "draw_text_ex")}
+    for name, f in real.items():
+        setattr(rl, name, count_calls(calls, name, f))
+    times = []
+    try:
+        for _ in range(FRAMES):
+            term.invalidate()
+            t1 = time.perf_counter()
+            term.render()
+            times.append(time.perf_counter() - t1)
+    finally:
+        for name, f in real.items():
+            setattr(rl, name, f)
+    return sum(calls.values()) / FRAMES, times
+
+
+def main():
+    rl.set_config_flags(rl.FLAG_WINDOW_HIDDEN)
+    screen = rl.Screen(800, 600)
+    term = Terminal(screen, cmd=None)
+    term.stream.feed(colored_screen(term.lines, term.columns))
+
+    print(f"Full-screen redraw, {term.columns}x{term.lines} cells, {FRAMES} frames")
+    for label, coalesce_runs in (("per cell", False), ("runs", True)):
+        calls, times = measure(term, coalesce_runs)
+        times.sort()
+        print(
+            f"{label:>10}: {calls:8.0f} FFI calls/frame, "
+            f"median {statistics.median(times) * 1000:7.2f} ms/frame, "
+            f"worst {times[-1] * 1000:7.2f} ms/frame"
+        )
+    rl.close_window()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Recorded pty output used by the benchmarks.
+
+A trace is everything a program wrote to its pty, byte by byte, stored
+gzipped in benchmarks/traces/<name>.trace.gz. To record them again:
+
+    python benchmarks/traces.py [name ...]
+
+Recording only needs the programs involved, not a display.
+"""
+
+import gzip
+import os
+import pty
+import select
+import sys
+import time
+from pathlib import Path
+
+TRACE_DIR = Path(__file__).parent / "traces"
+COLUMNS = 80
+LINES = 25
+
+# Limit traces to this much output, enough to take a while to replay
+MAX_SIZE = 2 << 20
+
+_BROKEN_C = """
+#include <stdio.h>
+int main(void) {
+    int x = "not a number";
+    undefined_function(x, y);
+    for (int i = 0; i < 10; i++) printf("%s", i)
+    return z;
+}
+"""
+
+_COLORED_LOG = r"""
+import random
+random.seed(1)
+levels = [("32", "INFO"), ("33", "WARN"), ("31", "ERROR"), ("36", "DEBUG")]
+for i in range(20000):
+    color, level = random.choice(levels)
+    print(f"\x1b[2m2020-10-{i % 28 + 1:02d} 12:{i % 60:02d}:{i * 7 % 60:02d}\x1b[0m "
+          f"\x1b[1;{color}m{level:5}\x1b[0m \x1b[35mworker-{i % 8}\x1b[0m "
+          f"request {i} took \x1b[1m{random.randint(1, 999)}ms\x1b[0m")
+"""
+
+# name -> (command, keys to type while it runs, seconds between keys)
+TRACES = {
+    "ls_lR": (["ls", "-lR", "/usr/lib"], [], 0),
+    "compiler": (
+        [
+            "sh",
+            "-c",
+            "for i in $(seq 30); do gcc -fdiagnostics-color=always -Wall "
+            "-x c -c -o /dev/null $0; done",
+            "/tmp/cobra_broken.c",
+        ],
+        [],
+        0,
+    ),
+    "colored_log": ([sys.executable, "-c", _COLORED_LOG], [], 0),
+    # htop is not always around, top is
+    "top": (["top", "-d", "0.1", "-n", "40"], [], 0),
+    # Same for micro and vim: scroll down a long file, then quit
+    "editor": (
+        [
+            "vim",
+            "-u",
+            "NONE",
+            "-c",
+            "syntax on",
+            str(Path(__file__).parent.parent / "cobra_py" / "keysyms.py"),
+        ],
+        [b"\x06"] * 40 + [b"\x02"] * 20 + [b":q!\r"],
+        0.05,
+    ),
+}
+
+
+def record(cmd, keys=(), delay=0, max_size=MAX_SIZE):
+    """Run cmd in a pty and return everything it outputs.
+
+    :keys: bytes to write to the program, one item every delay seconds.
+    """
+    pid, fd = pty.fork()
+    if pid == 0:  # Child process
+        env = dict(
+            os.environ,
+            TERM="xterm",
+            COLUMNS=str(COLUMNS),
+            LINES=str(LINES),
+            LC_ALL="C.UTF-8",
+        )
+        os.execvpe(cmd[0], cmd, env)
+    keys = list(keys)
+    data = bytearray()
+    next_key = time.monotonic() + 0.5  # Let it start
+    while len(data) < max_size:
+        ready, _, _ = select.select([fd], [], [], 0.01)
+        if ready:
+            try:
+                chunk = os.read(fd, 65536)
+            except OSError:  # EIO means the child is done
+                break
+            if not chunk:
+                break
+            data += chunk
+        if keys and time.monotonic() >= next_key:
+            os.write(fd, keys.pop(0))
+            next_key = time.monotonic() + delay
+    os.close(fd)
+    os.waitpid(pid, 0)
+    return bytes(data[:max_size])
+
+
+def load(names=None):
+    """Return [(name, data)] for the given trace names, or all of them."""
+    if not names:
+        names = sorted(p.name.split(".")[0] for p in TRACE_DIR.glob("*.trace.gz"))
+    return [(name, gzip.open(TRACE_DIR / f"{name}.trace.gz").read()) for name in names]
+
+
+def main():
+    with open("/tmp/cobra_broken.c", "w") as outf:
+        outf.write(_BROKEN_C)
+    TRACE_DIR.mkdir(exist_ok=True)
+    for name in sys.argv[1:] or TRACES:
+        data = record(*TRACES[name])
+        with gzip.open(TRACE_DIR / f"{name}.trace.gz", "wb") as outf:
+            outf.write(data)
+        print(f"{name}: {len(data)} bytes")
+
+
+if __name__ == "__main__":
+    main()
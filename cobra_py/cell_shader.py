@@ -0,0 +1,262 @@
+"""Draw a whole terminal with one quad and a fragment shader.
+
+Drawing a terminal with raylib's text functions costs Python work for
+every run of text, every frame something changes. Instead, each cell's
+glyph and colors are packed into a small texture, three texels per cell:
+
+    (fg.r, fg.g, fg.b, 255) (bg.r, bg.g, bg.b, 255) (slot & 255, slot >> 8, page, 255)
+
+and a fragment shader draws the terminal from that and the glyph atlas,
+in a single quad. Redrawing the whole screen costs about the same as
+redrawing one cell, the only per-cell work left is packing changed rows.
+
+raylib 3.0 can only give a 2D shader one texture, so the atlas pages and
+the cells share one 2048x2048 render texture, one in each quarter:
+
+    page 0 | page 1
+    -------+-------
+    page 2 | cells
+
+That's the most a Raspberry Pi can do, so an atlas used with the shader
+is limited to three pages.
+"""
+
+import os
+
+from cobra_py import rl
+from cobra_py.raylib import ffi
+
+# Same switch tasks.py uses to build raylib, the Pi only has OpenGL ES 2.
+# Goes before every fragment shader, here and in compositor.py.
+if os.environ.get("PLATFORM") == "RASPBERRY":
+    GLSL_HEADER = """#version 100
+#ifdef GL_FRAGMENT_PRECISION_HIGH
+precision highp float;
+#else
+precision mediump float;
+#endif
+#define texture texture2D
+#define finalColor gl_FragColor
+varying vec2 fragTexCoord;
+"""
+else:
+    GLSL_HEADER = """#version 330
+in vec2 fragTexCoord;
+out vec4 finalColor;
+"""
+
+_SHADER = """
+uniform sampler2D texture0;
+uniform vec2 grid;          // Terminal size in cells
+uniform vec2 cellSize;      // Cell size in pixels
+uniform float pageSize;     // Atlas page size in pixels, half the texture
+uniform float slotColumns;  // Glyph slots in a row of an atlas page
+
+// Render textures are upside down, p is in pixels from the top left
+vec4 sample(vec2 p) {
+    float size = pageSize * 2.0;
+    return texture(texture0, vec2(p.x, size - p.y) / size);
+}
+
+void main() {
+    vec2 position = fragTexCoord * grid;
+    vec2 cell = floor(position);
+    vec2 texel = vec2(pageSize + cell.x * 3.0 + 0.5, pageSize + cell.y + 0.5);
+    vec3 fg = sample(texel).rgb;
+    vec3 bg = sample(texel + vec2(1.0, 0.0)).rgb;
+    vec3 glyph = floor(sample(texel + vec2(2.0, 0.0)).rgb * 255.0 + 0.5);
+    float slot = glyph.r + glyph.g * 256.0;
+    vec2 page = vec2(mod(glyph.b, 2.0), floor(glyph.b / 2.0)) * pageSize;
+    vec2 corner = vec2(mod(slot, slotColumns), floor(slot / slotColumns)) * cellSize;
+    float coverage = sample(page + corner + (position - cell) * cellSize).r;
+    finalColor = vec4(mix(bg, fg, coverage), 1.0);
+}
+"""
+
+
+class CellShader:
+    """The shader and texture a screen's terminals draw their cells with.
+
+    Shared by all terminals using the same glyph atlas: the atlas pages
+    are copied in when the atlas changes, and each terminal copies its
+    cells in right before drawing. Making one limits the atlas to
+    max_pages pages.
+    """
+
+    # Atlas pages that fit in the texture, next to the cells
+    max_pages = 3
+
+    def __init__(self, glyphs):
+        if len(glyphs.pages) > self.max_pages:
+            raise ValueError("Too many glyph atlas pages for CellShader")
+        glyphs.max_pages = min(glyphs.max_pages, self.max_pages)
+        self.glyphs = glyphs
+        size = glyphs.page_size * 2
+        self.texture = rl.load_render_texture(size, size)
+        self._atlas_version = None
+        self.shader = rl.load_shader_code(ffi.NULL, GLSL_HEADER + _SHADER)
+        self._set("cellSize", (glyphs.cell_width, glyphs.cell_height), rl.UNIFORM_VEC2)
+        self._set("pageSize", glyphs.page_size, rl.UNIFORM_FLOAT)
+        self._set(
+            "slotColumns", glyphs.page_size // glyphs.cell_width, rl.UNIFORM_FLOAT
+        )
+
+    def _set(self, name, value, kind):
+        location = rl.get_shader_location(self.shader, name)
+        if kind == rl.UNIFORM_VEC2:
+            value = ffi.new("float[2]", value)
+        else:
+            value = ffi.new("float *", value)
+        rl.set_shader_value(self.shader, location, value, kind)
+
+    def _copy_atlas(self):
+        """Copy the atlas pages into the texture, if they changed."""
+        if self.glyphs.version == self._atlas_version:
+            return
+        self._atlas_version = self.glyphs.version
+        size = self.glyphs.page_size
+        rl.begin_texture_mode(self.texture)
+        rl.clear_background((0, 0, 0, 0))
+        # Pages are white with the glyphs in the alpha channel, so on
+        # black they come out with the coverage in the color channels.
+        for i, page in enumerate(self.glyphs.pages):
+            rl.draw_texture(page.font.texture, i % 2 * size, i // 2 * size, rl.WHITE)
+        rl.end_texture_mode()
+
+    def draw(self, cells, columns, lines, target):
+        """Draw a terminal whose cells are packed in the cells texture.
+
+        It's drawn into the target render texture, with its top left
+        corner at 0, 0. Don't call in texture mode, this needs to use
+        its own texture first.
+        """
+        self._copy_atlas()
+        size = self.glyphs.page_size
+        rl.begin_texture_mode(self.texture)
+        # Cells are opaque, so this is a plain copy
+        rl.draw_texture(cells, size, size, rl.WHITE)
+        rl.end_texture_mode()
+
+        self._set("grid", (columns, lines), rl.UNIFORM_VEC2)
+        rl.begin_texture_mode(target)
+        rl.begin_shader_mode(self.shader)
+        texture = self.texture.texture
+        rl.draw_texture_pro(
+            texture,
+            (0, 0, texture.width, texture.height),
+            (0, 0, columns * self.glyphs.cell_width, lines * self.glyphs.cell_height),
+            (0, 0),
+            0,
+            rl.WHITE,
+        )
+        rl.end_shader_mode()
+        rl.end_texture_mode()
+
+
+class CellGrid:
+    """A terminal's cells, packed into a texture for CellShader."""
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.glyphs = terminal.glyphs
+        self.columns = terminal.columns
+        self.lines = terminal.lines
+        if (
+            self.columns * 3 > self.glyphs.page_size
+            or self.lines > self.glyphs.page_size
+        ):
+            raise ValueError(
+                f"Too many cells for CellShader: {self.columns}x{self.lines}"
+            )
+        self.shader = terminal._screen.shared(
+            ("cell_shader", id(self.glyphs)), lambda: CellShader(self.glyphs)
+        )
+        self.pixels = bytearray(self.columns * 3 * 4 * self.lines)
+        image = ffi.new(
+            "Image *",
+            (
+                ffi.from_buffer(self.pixels),
+                self.columns * 3,
+                self.lines,
+                1,
+                rl.UNCOMPRESSED_R8G8B8A8,
+            ),
+        )
+        self.texture = rl.load_texture_from_image(image[0])
+        self._packed = {}  # Char -> its 12 bytes
+        self._evictions = self.glyphs.evictions
+
+    def _pack(self, char):
+        fg, bg = self.terminal.colors.resolve(char)
+        page, slot = self.glyphs.locate(char.data[:1] or " ")
+        packed = bytes(
+            (
+                fg.r,
+                fg.g,
+                fg.b,
+                255,
+                bg.r,
+                bg.g,
+                bg.b,
+                255,
+                slot & 255,
+                slot >> 8,
+                page,
+                255,
+            )
+        )
+        if len(self._packed) > 4096:
+            self._packed.clear()
+        self._packed[char] = packed
+        return packed
+
+    @property
+    def stale(self):
+        """Whether glyphs moved since the last update, see update."""
+        return self.glyphs.evictions != self._evictions
+
+    def update(self, rows):
+        """Pack the given rows into the texture.
+
+        If glyphs moved in the atlas since the last update (this or
+        anything else sharing it added glyphs and evicted others), any
+        packed cell could be pointing at the wrong one, so all rows are
+        packed again. Same if packing these rows evicted glyphs. While
+        packing all rows, the glyphs evicted can't be any they show,
+        those were just used, unless they show more different characters
+        than the atlas can hold.
+        """
+        full = self.stale
+        if not full:
+            self._pack_rows(rows)
+            full = self.stale
+        if full:
+            self._packed.clear()
+            self._pack_rows(range(self.lines))
+        self._evictions = self.glyphs.evictions
+        rl.update_texture(self.texture, ffi.from_buffer(self.pixels))
+
+    def _pack_rows(self, rows):
+        terminal = self.terminal
+        packed = self._packed
+        pack = self._pack
+        row_size = self.columns * 12
+        for y in rows:
+            if not 0 <= y < self.lines:
+                continue
+            line = terminal.visible_line(y)
+            data = []
+            for x in range(self.columns):  # Can't enumerate, it's sparse
+                char = line[x]
+                try:
+                    data.append(packed[char])
+                except KeyError:
+                    data.append(pack(char))
+            start = y * row_size
+            self.pixels[slice(start, start + row_size)] = b"".join(data)
+
+    def draw(self, target):
+        self.shader.draw(self.texture, self.columns, self.lines, target)
+
+    def unload(self):
+        rl.unload_texture(self.texture)
@@ -0,0 +1,136 @@
+"""Resolve pyte colors into raylib Colors.
+
+Pyte describes colors as names ("red", "brightblue"), "default" or
+6-digit hex strings. Turning those into something raylib can use means
+parsing the string and having CFFI build a Color struct, which is too
+much work to do for every cell we draw, so it's done once and cached.
+
+Nothing here needs raylib itself, so the same logic can produce plain
+tuples for headless.py.
+"""
+
+from collections import OrderedDict
+
+from pyte.graphics import FG_BG_256
+
+try:
+    from cobra_py.raylib import ffi
+except ImportError:  # Only plain tuples, see headless.py
+    ffi = None
+
+
+def parse_color(rgb):
+    r = int(rgb[:2], 16)
+    g = int(rgb[2:4], 16)
+    b = int(rgb[4:6], 16)
+    color = (r, g, b, 255)
+    return color
+
+
+# Same as raylib's RAYWHITE and BLACK
+DEFAULT_FG = (245, 245, 245, 255)
+DEFAULT_BG = (0, 0, 0, 255)
+
+# Named colors pyte uses for the 16 basic ANSI colors, the basic ones
+# are the raylib colors with those names.
+_names = {
+    "black": (0, 0, 0, 255),
+    "red": (230, 41, 55, 255),
+    "green": (0, 228, 48, 255),
+    "brown": (127, 106, 79, 255),
+    "blue": (0, 121, 241, 255),
+    "magenta": (255, 0, 255, 255),
+    "cyan": (0, 255, 255, 255),
+    "white": (255, 255, 255, 255),
+}
+for _i, _name in enumerate(
+    ["black", "red", "green", "brown", "blue", "magenta", "cyan", "white"]
+):
+    _names["bright" + _name] = parse_color(FG_BG_256[8 + _i])
+# Typo in pyte.graphics.BG_AIXTERM
+_names["bfightmagenta"] = _names["brightmagenta"]
+
+
+class ColorCache:
+    """Raylib Colors for pyte color descriptions, ready to pass to CFFI.
+
+    The named colors and the whole xterm 256 color palette are converted
+    when the cache is created. Other (truecolor) values are converted
+    when first seen and kept in a LRU of at most `size` entries.
+
+    Resolved (fg, bg, reverse) combinations are memoized too, so drawing
+    a cell usually costs a single dict lookup.
+    """
+
+    def __init__(self, default_fg=DEFAULT_FG, default_bg=DEFAULT_BG, size=1024):
+        self.size = size
+        # CFFI structs obtained by indexing a pointer don't own their
+        # memory, so we need to keep the pointers around.
+        self._owners = []
+        self._palette = {}
+        for name, color in _names.items():
+            self._palette[name] = self._convert(color, self._owners)
+        for rgb in FG_BG_256:
+            self._palette[rgb] = self._convert(parse_color(rgb), self._owners)
+        self._fg_palette = dict(
+            self._palette, default=self._convert(default_fg, self._owners)
+        )
+        self._bg_palette = dict(
+            self._palette, default=self._convert(default_bg, self._owners)
+        )
+
+        self._truecolor = OrderedDict()  # rgb -> (owners, color)
+        self._pairs = {}
+
+    @staticmethod
+    def _convert(color, owners):
+        if not isinstance(color, tuple):  # Already a Color, like rl.RED
+            return color
+        owner = ffi.new("Color *", color)
+        owners.append(owner)
+        return owner[0]
+
+    def _truecolor_get(self, rgb):
+        try:
+            self._truecolor.move_to_end(rgb)
+            return self._truecolor[rgb][1]
+        except KeyError:
+            pass
+        owners = []
+        color = self._convert(parse_color(rgb), owners)
+        self._truecolor[rgb] = (owners, color)
+        if len(self._truecolor) > self.size:
+            self._truecolor.popitem(last=False)
+            # Memoized pairs may be using the color we just dropped
+            self._pairs.clear()
+        return color
+
+    def fg(self, name):
+        """Color for foreground `name`."""
+        try:
+            return self._fg_palette[name]
+        except KeyError:
+            return self._truecolor_get(name)
+
+    def bg(self, name):
+        """Color for background `name`."""
+        try:
+            return self._bg_palette[name]
+        except KeyError:
+            return self._truecolor_get(name)
+
+    def resolve(self, char):
+        """Return the (foreground, background) Colors to draw char with."""
+        key = (char.fg, char.bg, char.reverse)
+        try:
+            return self._pairs[key]
+        except KeyError:
+            pass
+        fg = self.fg(char.fg)
+        bg = self.bg(char.bg)
+        if char.reverse:
+            fg, bg = bg, fg
+        if len(self._pairs) >= self.size:
+            self._pairs.clear()
+        self._pairs[key] = (fg, bg)
+        return fg, bg
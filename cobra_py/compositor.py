@@ -0,0 +1,187 @@
+"""Compose all of a Screen's layers in one pass, with one shader.
+
+Screen normally draws each enabled layer's texture over the previous
+ones, a full screen blended pass per layer. Instead, a Compositor draws
+a single quad covering the screen, with a fragment shader that reads
+every layer's texture and blends them itself, so each pixel of the
+window is written once however many layers there are.
+
+raylib 3.0 only gives a shader more than one texture through a
+model's material maps, so that's what the quad is: a plane model, with
+the layer textures as its maps. Each map is bound to the texture unit
+of the same number, and maps 7 to 9 are cube maps, which leaves eight
+for layers. On the Raspberry Pi, OpenGL ES 2 only has units 0 to 7, so
+there it's seven. With more enabled layers than that, Screen goes back
+to drawing them one by one.
+
+Since the layers are already blended in the shader, changing how the
+final color looks is nearly free: that's effect, GLSL code defining
+
+    vec3 effect(vec3 color, vec2 pixel)
+
+which gets each pixel's composed color and position (in pixels from
+the top left) and returns the color to show. See SCANLINES and tint.
+
+Overlays (cursors, sprites) are drawn on top of the composed layers,
+in layer order, not between them.
+"""
+
+import os
+
+from cobra_py import rl
+from cobra_py.cell_shader import GLSL_HEADER
+from cobra_py.raylib import ffi
+
+# Material maps DrawModel binds as 2D textures, to the unit with their
+# number. Same switch as GLSL_HEADER, the Pi has no unit 10.
+if os.environ.get("PLATFORM") == "RASPBERRY":
+    _SLOTS = (0, 1, 2, 3, 4, 5, 6)
+else:
+    _SLOTS = (0, 1, 2, 3, 4, 5, 6, 10)
+
+NO_EFFECT = """
+vec3 effect(vec3 color, vec2 pixel) {
+    return color;
+}
+"""
+
+# Every other row of pixels darker, like an old CRT
+SCANLINES = """
+vec3 effect(vec3 color, vec2 pixel) {
+    return mod(floor(pixel.y), 2.0) < 1.0 ? color : color * 0.6;
+}
+"""
+
+
+def tint(color):
+    """An effect showing everything in shades of color, like a monochrome monitor.
+
+    :color: (r, g, b), 0-255
+    """
+    r, g, b = (c / 255 for c in color[:3])
+    return f"""
+vec3 effect(vec3 color, vec2 pixel) {{
+    return vec3({r}, {g}, {b}) * dot(color, vec3(0.299, 0.587, 0.114));
+}}
+"""
+
+
+_LAYER = """
+uniform vec2 screen;  // Screen size in pixels
+
+// A layer's color at pixel p, transparent outside of it.
+// rect is where the layer is on the screen, x, y, width, height.
+vec4 layer(sampler2D tex, vec4 rect, vec2 p) {
+    vec2 uv = (p - rect.xy) / rect.zw;
+    if (uv.x < 0.0 || uv.y < 0.0 || uv.x > 1.0 || uv.y > 1.0) {
+        return vec4(0.0);
+    }
+    // Render textures are upside down
+    return texture(tex, vec2(uv.x, 1.0 - uv.y));
+}
+"""
+
+
+def _source(count, effect):
+    """Fragment shader source for composing count layers."""
+    declarations = []
+    blends = []
+    for i in range(count):
+        declarations.append(f"uniform sampler2D layer{i};\nuniform vec4 rect{i};\n")
+        blends.append(
+            f"    c = layer(layer{i}, rect{i}, p);\n"
+            "    color = mix(color, c.rgb, c.a);\n"
+        )
+    return (
+        GLSL_HEADER
+        + "".join(declarations)
+        + _LAYER
+        + effect
+        + """
+void main() {
+    // gl_FragCoord starts at the bottom left
+    vec2 p = vec2(gl_FragCoord.x, screen.y - gl_FragCoord.y);
+    vec3 color = vec3(0.0);  // The background is black
+    vec4 c;
+"""
+        + "".join(blends)
+        + """    finalColor = vec4(effect(color, p), 1.0);
+}
+"""
+    )
+
+
+class Compositor:
+    """Draws a Screen's layers with one shader, see the module docstring.
+
+    To use it, set it as the screen's compositor::
+
+        screen.compositor = Compositor(screen, effect=SCANLINES)
+    """
+
+    def __init__(self, screen, effect=NO_EFFECT):
+        self.screen = screen
+        self.effect = effect
+        # A plane is made lying flat, facing up. Standing it up, facing
+        # the 2D camera, it covers the screen, see draw.
+        self.model = rl.load_model_from_mesh(
+            rl.gen_mesh_plane(screen.width, screen.height, 1, 1)
+        )
+        self.material = self.model.materials[0]
+        self._shaders = {}  # Layer count -> (shader, rect locations)
+
+    def _shader(self, count):
+        """The shader for count layers, compiled the first time it's needed."""
+        try:
+            return self._shaders[count]
+        except KeyError:
+            pass
+        shader = rl.load_shader_code(ffi.NULL, _source(count, self.effect))
+        location = rl.get_shader_location(shader, "screen")
+        size = ffi.new("float[2]", (self.screen.width, self.screen.height))
+        rl.set_shader_value(shader, location, size, rl.UNIFORM_VEC2)
+        rects = []
+        for i, slot in enumerate(_SLOTS[:count]):
+            # Where DrawModel says which unit the map in slot is bound to
+            shader.locs[rl.LOC_MAP_ALBEDO + slot] = rl.get_shader_location(
+                shader, f"layer{i}"
+            )
+            rects.append(rl.get_shader_location(shader, f"rect{i}"))
+        self._shaders[count] = shader, rects
+        return shader, rects
+
+    def draw(self, layers):
+        """Compose the textures of layers, in order, over a black background.
+
+        Returns False without drawing anything if there are too many.
+        """
+        layers = [layer for layer in layers if layer.texture is not None]
+        if len(layers) > len(_SLOTS):
+            return False
+        shader, rects = self._shader(len(layers))
+        self.material.shader = shader
+        maps = self.material.maps
+        for slot in _SLOTS:
+            maps[slot].texture.id = 0  # Not bound
+        for layer, slot, location in zip(layers, _SLOTS, rects):
+            maps[slot].texture = layer.texture.texture
+            rect = ffi.new(
+                "float[4]",
+                (
+                    layer.x,
+                    layer.y,
+                    layer.texture.texture.width,
+                    layer.texture.texture.height,
+                ),
+            )
+            rl.set_shader_value(shader, location, rect, rl.UNIFORM_VEC4)
+        rl.draw_model_ex(
+            self.model,
+            # Between the near and far planes of the 2D camera, 0 and -1
+            (self.screen.width / 2, self.screen.height / 2, -0.5),
+            (1, 0, 0),
+            -90,
+            (1, 1, 1),
+            rl.WHITE,
+        )
+        return True
@@ -0,0 +1,89 @@
+"""A pyte Screen that is faster for plain ASCII text."""
+
+import pyte
+from pyte import modes as mo
+from pyte.charsets import LAT1_MAP
+
+
+class FastScreen(pyte.Screen):
+    """A pyte.Screen with a fast path for printable ASCII text.
+
+    Pyte's stream already hands runs of text without control codes to
+    draw() in one go, but draw() then handles them one character at a
+    time, checking its width and building a new Char for it.
+
+    For printable ASCII, every character is one cell wide, so a run can
+    be written to the buffer a line at a time. The Chars are interned,
+    one per character and set of attributes, which also makes comparing
+    them (as Terminal does to find what changed) cheaper.
+
+    Anything else, and ASCII while insert mode or a non-default charset
+    is active, goes through pyte's draw().
+
+    It also copes with private CSI sequences pyte passes on to methods
+    that don't expect them.
+    """
+
+    ascii_fast_path = True
+
+    def __init__(self, *a, **kw):
+        # attributes -> {character: Char}
+        self._interned = {}
+        super().__init__(*a, **kw)
+
+    def _chars_for(self, attrs):
+        try:
+            return self._interned[attrs]
+        except KeyError:
+            if len(self._interned) > 256:
+                self._interned.clear()
+            chars = self._interned[attrs] = {
+                chr(c): attrs._replace(data=chr(c)) for c in range(32, 127)
+            }
+            return chars
+
+    def set_margins(self, *args, **kwargs):
+        # See https://github.com/selectel/pyte/issues/67
+        kwargs.pop("private", None)
+        return super().set_margins(*args, **kwargs)
+
+    def select_graphic_rendition(self, *args, **kwargs):
+        # CSI ? ... m isn't SGR. Neither is CSI > ... m (xterm's
+        # modifyOtherKeys), but pyte drops the >, so TerminalStream takes
+        # those out before they get here.
+        if kwargs.get("private"):
+            return
+        return super().select_graphic_rendition(*args)
+
+    def draw(self, data):
+        if (
+            not self.ascii_fast_path
+            or not data.isascii()
+            or not data.isprintable()
+            or mo.IRM in self.mode
+            or (self.g1_charset if self.charset else self.g0_charset) is not LAT1_MAP
+        ):
+            return super().draw(data)
+
+        cursor = self.cursor
+        columns = self.columns
+        chars = self._chars_for(cursor.attrs)
+        while data:
+            # Same as pyte: wrap before writing past the end of the line
+            if cursor.x == columns:
+                if mo.DECAWM in self.mode:
+                    self.dirty.add(cursor.y)
+                    self.carriage_return()
+                    self.linefeed()
+                else:  # Keep overwriting the last cell
+                    cursor.x -= 1
+                    data = data[-1]
+            x = cursor.x
+            count = min(len(data), columns - x)
+            self.buffer[cursor.y].update(
+                zip(range(x, x + count), map(chars.__getitem__, data[:count]))
+            )
+            cursor.x = x + count
+            data = data[count:]
+
+        self.dirty.add(cursor.y)
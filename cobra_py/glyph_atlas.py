@@ -0,0 +1,244 @@
+"""Glyphs of a monospaced font, rasterized into textures as they are needed."""
+
+from collections import OrderedDict
+
+# Not cobra_py.rl, which imports this module
+from cobra_py.raylib import ffi, lib
+
+# Always there, and never evicted
+_ASCII = range(32, 127)
+
+
+class _Page:
+    """One atlas texture, a grid of cell sized slots, each holding a glyph.
+
+    It's also a raylib Font whose characters are whatever glyphs are
+    in the slots, so DrawTextEx can draw with it directly.
+    """
+
+    def __init__(self, size, cell_width, cell_height, font_size):
+        self.columns = size // cell_width
+        self.slots = self.columns * (size // cell_height)
+        self.width = self.height = size
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.used = 0
+        self.dirty = False
+        # White, with the glyphs in the alpha channel
+        self.pixels = bytearray(b"\xff\x00" * size * size)
+
+        image = ffi.new(
+            "Image *",
+            (ffi.from_buffer(self.pixels), size, size, 1, lib.UNCOMPRESSED_GRAY_ALPHA),
+        )
+        self._recs = ffi.new("Rectangle[]", self.slots)
+        self._chars = ffi.new("CharInfo[]", self.slots)
+        for slot in range(self.slots):
+            row, column = divmod(slot, self.columns)
+            self._recs[slot] = (
+                column * cell_width,
+                row * cell_height,
+                cell_width,
+                cell_height,
+            )
+            self._chars[slot].advanceX = cell_width
+        self._font = ffi.new("Font *")
+        self._font.baseSize = font_size
+        self._font.charsCount = self.slots
+        self._font.texture = lib.LoadTextureFromImage(image[0])
+        self._font.recs = self._recs
+        self._font.chars = self._chars
+        self.font = self._font[0]
+
+    def put(self, slot, codepoint, glyph):
+        """Store glyph (a raylib CharInfo) for codepoint in slot."""
+        self._chars[slot].value = codepoint
+        width = self.width
+        row, column = divmod(slot, self.columns)
+        cell_x = column * self.cell_width
+        cell_y = row * self.cell_height
+
+        # Blank the slot, then copy the glyph's coverage where DrawTextEx
+        # would draw it relative to the cell, clipped to the cell.
+        blank = bytes(self.cell_width)
+        for y in range(cell_y, cell_y + self.cell_height):
+            start = (y * width + cell_x) * 2 + 1
+            self.pixels[slice(start, start + 2 * self.cell_width, 2)] = blank
+        image = glyph.image
+        if image.data != ffi.NULL:
+            data = ffi.buffer(image.data, image.width * image.height)
+            left = max(glyph.offsetX, 0)
+            right = min(glyph.offsetX + image.width, self.cell_width)
+            top = max(glyph.offsetY, 0)
+            bottom = min(glyph.offsetY + image.height, self.cell_height)
+            for y in range(top, bottom):
+                src = (y - glyph.offsetY) * image.width - glyph.offsetX
+                dst = ((cell_y + y) * width + cell_x + left) * 2 + 1
+                row = data[slice(src + left, src + right)]
+                self.pixels[slice(dst, dst + 2 * len(row), 2)] = row
+        self.dirty = True
+
+    def upload(self):
+        if self.dirty:
+            lib.UpdateTexture(self._font.texture, ffi.from_buffer(self.pixels))
+            self.dirty = False
+
+    def unload(self):
+        lib.UnloadTexture(self._font.texture)
+
+
+class GlyphAtlas:
+    """Draws text in a monospaced font, rasterizing glyphs on demand.
+
+    Loading every glyph a font has up front is slow and needs a lot of
+    texture memory, so this starts with ASCII and adds other characters
+    the first time they are drawn. They go into atlas pages, textures of
+    page_size x page_size pixels, adding pages as needed up to max_pages.
+    When those are full, the least recently drawn glyph is replaced.
+
+    Every glyph is rendered into a cell_width x cell_height cell (the
+    width of "X" by the font size), so text is always drawn on a grid,
+    which is what a terminal needs anyway.
+    """
+
+    def __init__(self, font_path, font_size, page_size=1024, max_pages=4):
+        self.font_path = str(font_path).encode("utf-8")
+        self.font_size = font_size
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = []
+        # Bumped whenever glyphs are added, and when one replaces another
+        self.version = 0
+        self.evictions = 0
+        self._where = {}  # character -> (page, slot)
+        self._recent = OrderedDict()  # Non-ASCII characters, oldest first
+
+        glyphs = self._rasterize(_ASCII)
+        self.cell_width = glyphs[ord("X") - 32].advanceX
+        self.cell_height = font_size
+        self._add(_ASCII, glyphs)
+        if self._where["~"][0] != 0:
+            raise ValueError(f"page_size {page_size} is too small for ASCII")
+        self.pages[0].upload()
+        # Where text made of nothing but ASCII can be drawn in one go
+        self.font = self.pages[0].font
+
+    def _rasterize(self, codepoints):
+        codepoints = list(codepoints)
+        glyphs = lib.LoadFontData(
+            self.font_path,
+            self.font_size,
+            ffi.new("int[]", codepoints),
+            len(codepoints),
+            lib.FONT_DEFAULT,
+        )
+        # raylib 3.0 has no way to free the glyphs array itself, but it's
+        # small and only happens when characters are seen the first time.
+        return glyphs
+
+    def _slot(self):
+        """Find a free slot, making a page or evicting a glyph if needed."""
+        if not self.pages or self.pages[-1].used == self.pages[-1].slots:
+            if len(self.pages) < self.max_pages:
+                self.pages.append(
+                    _Page(
+                        self.page_size,
+                        self.cell_width,
+                        self.cell_height,
+                        self.font_size,
+                    )
+                )
+            else:
+                char, _ = self._recent.popitem(last=False)
+                self.evictions += 1
+                return self._where.pop(char)
+        page = len(self.pages) - 1
+        slot = self.pages[page].used
+        self.pages[page].used += 1
+        return page, slot
+
+    def _add(self, codepoints, glyphs):
+        for i, codepoint in enumerate(codepoints):
+            page, slot = self._slot()
+            self.pages[page].put(slot, codepoint, glyphs[i])
+            lib.UnloadImage(glyphs[i].image)
+            self._where[chr(codepoint)] = (page, slot)
+            if codepoint not in _ASCII:
+                self._recent[chr(codepoint)] = None
+        self.version += 1
+
+    def load(self, text):
+        """Make sure all characters in text are in the atlas.
+
+        Returns, for each character, the page it's in.
+        """
+        if text.isascii():
+            return [0] * len(text)
+        # Mark the characters already there as just used first, so adding
+        # the missing ones can't evict them.
+        recent = self._recent
+        missing = set()
+        for char in text:
+            if char in recent:
+                recent.move_to_end(char)
+            elif char not in self._where:
+                missing.add(char)
+        if missing:
+            evictions = self.evictions
+            codepoints = sorted(ord(char) for char in missing)
+            self._add(codepoints, self._rasterize(codepoints))
+            if self.evictions != evictions:
+                # Text drawn earlier in this frame may still be waiting in
+                # raylib's batch, pointing to a slot that now holds another
+                # glyph. Draw it before the page changes.
+                lib.rlglDraw()
+        for page in self.pages:
+            page.upload()
+        return [self._where[char][0] for char in text]
+
+    def locate(self, char):
+        """Return (page, slot) for the glyph of char, adding it if needed."""
+        if char not in self._where:
+            self.load(char)
+        elif char in self._recent:
+            self._recent.move_to_end(char)
+        return self._where[char]
+
+    def draw_text(self, text, position, color):
+        """Draw text with its top left corner at position, one character per cell."""
+        x, y = position
+        if text.isascii():
+            lib.DrawTextEx(
+                self.font, text.encode("utf-8"), (x, y), self.font_size, 0, color
+            )
+            return
+        width = self.cell_width
+        pages = self.load(text)
+        # One call per run of characters in the same page. Spaces are not
+        # drawn, just skipped, so they can go in any run.
+        start = 0
+        page = pages[0]
+        for i, char in enumerate(text):
+            if char != " " and pages[i] != page:
+                if text[start:i].strip():
+                    self._draw_run(text[start:i], page, (x + start * width, y), color)
+                start = i
+                page = pages[i]
+        self._draw_run(text[start:], page, (x + start * width, y), color)
+
+    def _draw_run(self, text, page, position, color):
+        lib.DrawTextEx(
+            self.pages[page].font,
+            text.encode("utf-8"),
+            position,
+            self.font_size,
+            0,
+            color,
+        )
+
+    def unload(self):
+        for page in self.pages:
+            page.unload()
+        self.pages = []
+        self._where.clear()
+        self._recent.clear()
@@ -32,6 +32,17 @@ class Server(rl.Layer):
         self.music_playing = None
         rl.init_audio_device()
 
+    # Hidden, it still runs commands (clients wait for r_ results) and
+    # keeps the music playing, but doesn't need every frame for that.
+    update_policy = "pending"
+
+    def pending(self):
+        return (
+            self.enabled
+            or self.music_playing is not None
+            or self.command_queue.qsize() > 0
+        )
+
     def get_key_events(self) -> Queue:
         q_id = "/" + uuid.uuid4().hex
         self.event_queues.append(Queue(q_id))
@@ -71,7 +82,7 @@ class Server(rl.Layer):
 
     def load_sprite(self, name: str, image: str):
         """Add a sprite to the sprite layer."""
-        self.sprites.load_sprite(name, image.encode("utf8"))
+        self.sprites.load_sprite(name, image)
 
     def move_sprite(self, name: str, x: int, y: int):
         # FIXME move error check into Sprites
@@ -88,10 +99,13 @@ class Server(rl.Layer):
     def update(self):
         if self.music_playing:
             rl.update_music_stream(self.musics[self.music_playing])
+            # The stream needs feeding every frame, don't let Screen wait
+            self.damaged = True
         rl.BeginTextureMode(self.texture)
         try:
             while True:
                 command, a, kw = self.command_queue.get(False)
+                self.damaged = True
                 fn = getattr(self, command, None)
                 if fn is None:
                     print("Unknown command:", command)
@@ -108,13 +122,13 @@ class Server(rl.Layer):
         rl.draw_circle(x, y, int(radius), color)
 
     def load_sound(self, name, path):
-        self.sounds[name] = rl.load_sound(path.encode("utf-8"))
+        self.sounds[name] = rl.load_sound(path)
 
     def play_sound(self, name):
         rl.play_sound(self.sounds[name])
 
     def load_music_stream(self, name, path):
-        self.musics[name] = rl.load_music_stream(path.encode("utf-8"))
+        self.musics[name] = rl.load_music_stream(path)
 
     def play_music_stream(self, name):
         rl.play_music_stream(self.musics[name])
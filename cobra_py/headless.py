@@ -0,0 +1,205 @@
+"""Draw what a terminal shows into a NumPy array, without raylib.
+
+Good for snapshot tests, for measuring throughput offline, and for
+making thumbnails of a terminal on a server with no GPU or X server.
+
+The glyphs come from a table pre-rasterized from the bundled monoid
+font, shipped in resources/fonts. Making a new one with
+
+    python -m cobra_py.headless [size]
+
+needs the raylib binding, but only its font loading code, not a window.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from cobra_py.colors import ColorCache
+
+FONT_DIR = Path(__file__).parent / "resources" / "fonts"
+# Same font and size rl.Screen uses
+FONT_SIZE = 24
+CODEPOINTS = range(32, 32 + 256)
+
+# Same as Terminal.draw_overlay, white with this alpha over the cell
+CURSOR_ALPHA = 100
+
+
+def _table_path(size):
+    return FONT_DIR / f"monoid_{size}.npz"
+
+
+class GlyphTable:
+    """The glyphs of a monospaced font, each one rendered into a cell.
+
+    glyphs[i] is a (height, width) array with the coverage (0-255) of
+    codepoints[i], already placed where raylib's DrawTextEx would put it
+    when drawing it at the cell's top left corner.
+    """
+
+    def __init__(self, glyphs, codepoints):
+        self.glyphs = glyphs
+        self.height, self.width = glyphs.shape[1:]
+        self.codepoints = list(codepoints)
+        self._index = {chr(c): i for i, c in enumerate(self.codepoints)}
+        self.missing = self._index.get("?", 0)
+
+    def index(self, text):
+        """Index of the glyph to draw text with, "?" if the font doesn't have it.
+
+        Cells holding more than one codepoint are drawn as the first one.
+        """
+        return self._index.get(text[:1] or " ", self.missing)
+
+    @classmethod
+    def load(cls, size=FONT_SIZE):
+        """Load the pre-rasterized table for the bundled font."""
+        with np.load(_table_path(size)) as data:
+            return cls(data["glyphs"], data["codepoints"].tolist())
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            glyphs=self.glyphs,
+            codepoints=np.array(self.codepoints, dtype=np.uint32),
+        )
+
+    @classmethod
+    def rasterize(cls, font_path, size, codepoints=CODEPOINTS):
+        """Render codepoints from a TTF font at size pixels, using raylib.
+
+        Cells are as wide as "X" and size pixels high, which is what
+        rl.Screen measures as text_size.
+        """
+        from cobra_py import rl
+        from cobra_py.raylib import ffi
+
+        codepoints = list(codepoints)
+        chars = rl.load_font_data(
+            str(font_path),
+            size,
+            ffi.new("int[]", codepoints),
+            len(codepoints),
+            rl.FONT_DEFAULT,
+        )
+        width = chars[codepoints.index(ord("X"))].advanceX
+        glyphs = np.zeros((len(codepoints), size, width), np.uint8)
+        for i in range(len(codepoints)):
+            char = chars[i]
+            image = char.image
+            if image.data != ffi.NULL:
+                pixels = np.frombuffer(
+                    ffi.buffer(image.data, image.width * image.height), np.uint8
+                ).reshape(image.height, image.width)
+                _paste(glyphs[i], pixels, char.offsetX, char.offsetY)
+            rl.unload_image(image)
+        # raylib 3.0 has no way to free the chars array itself, but
+        # this is only done once when making the table.
+        return cls(glyphs, codepoints)
+
+
+def _paste(cell, pixels, x, y):
+    """Copy pixels into cell with its top left corner at x, y, clipping."""
+    height, width = cell.shape
+    top, left = max(y, 0), max(x, 0)
+    bottom = min(y + pixels.shape[0], height)
+    right = min(x + pixels.shape[1], width)
+    if top < bottom and left < right:
+        rows = slice(top - y, bottom - y)
+        columns = slice(left - x, right - x)
+        cell[top:bottom, left:right] = pixels[rows, columns]
+
+
+class RGBColors(ColorCache):
+    """Same colors as Terminal uses, as (r, g, b) tuples."""
+
+    @staticmethod
+    def _convert(color, owners):
+        return tuple(color[:3])
+
+
+class HeadlessRenderer:
+    """Rasterize a pyte Screen into an RGBA NumPy array.
+
+    The result uses the same colors and cursor overlay as Terminal's
+    layer texture. If the screen is a Terminal, what is shown is
+    what it would show, including scrolling back and search highlights.
+    """
+
+    def __init__(self, glyphs: GlyphTable = None, colors: ColorCache = None):
+        self.glyphs = glyphs or GlyphTable.load()
+        self.colors = colors or RGBColors()
+
+    def render(self, screen, cursor=True):
+        """Return a (lines * height, columns * width, 4) uint8 array.
+
+        :cursor: whether to draw the cursor. It's drawn in the
+                 screen's cursor_shape if it has one, and never blinks.
+        """
+        lines, columns = screen.lines, screen.columns
+        visible_line = getattr(screen, "visible_line", screen.buffer.__getitem__)
+        index = self.glyphs.index
+        resolve = self.colors.resolve
+        glyph_ids = []
+        colors = []
+        for y in range(lines):
+            line = visible_line(y)
+            for x in range(columns):  # Can't enumerate, it's sparse
+                char = line[x]
+                glyph_ids.append(index(char.data))
+                colors.append(resolve(char))
+        colors = np.array(colors, np.uint16).reshape(lines, columns, 2, 3)
+        fg = colors[:, :, 0, None, None]
+        bg = colors[:, :, 1, None, None]
+        # Coverage of each cell's glyph, shape (lines, columns, h, w, 1)
+        alpha = self.glyphs.glyphs[np.array(glyph_ids).reshape(lines, columns)]
+        alpha = alpha[..., None].astype(np.uint16)
+        rgb = (fg * alpha + bg * (255 - alpha) + 127) // 255
+
+        h, w = self.glyphs.height, self.glyphs.width
+        image = np.full((lines, h, columns, w, 4), 255, np.uint8)
+        image[..., :3] = rgb.transpose(0, 2, 1, 3, 4)
+        image = image.reshape(lines * h, columns * w, 4)
+
+        x, y = screen.cursor.x, screen.cursor.y
+        if (
+            cursor
+            and not screen.cursor.hidden
+            and not getattr(screen, "view_offset", 0)
+            and 0 <= x < columns
+            and 0 <= y < lines
+        ):
+            top, left = y * h, x * w
+            bottom, right = top + h, left + w
+            thickness = max(2, h // 12)
+            shape = getattr(screen, "cursor_shape", "block")
+            if shape == "underline":
+                top = bottom - thickness
+            elif shape == "bar":
+                right = left + thickness
+            cell = image[top:bottom, left:right, :3]
+            cell += ((255 - cell.astype(np.uint16)) * CURSOR_ALPHA + 127) // 255
+        return image
+
+
+def thumbnail(image, factor):
+    """Shrink an image from HeadlessRenderer.render by factor, averaging pixels."""
+    height = image.shape[0] // factor * factor
+    width = image.shape[1] // factor * factor
+    blocks = image[:height, :width].reshape(
+        height // factor, factor, width // factor, factor, image.shape[2]
+    )
+    return blocks.mean(axis=(1, 3)).round().astype(np.uint8)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else FONT_SIZE
+    table = GlyphTable.rasterize(FONT_DIR / "monoid.ttf", size)
+    table.save(_table_path(size))
+    print(f"{len(table.codepoints)} glyphs, {table.width}x{table.height} cells")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Images sent to a terminal inline, with kitty's graphics protocol.
+
+A program draws an image by writing an APC escape sequence,
+
+    ESC _ G <key>=<value>,<key>=<value>... ; <base64 data> ESC \\
+
+to the terminal, in the same stream as its text, so they can't end up
+out of order like with the graphics server's queues. See
+https://sw.kovidgoyal.net/kitty/graphics-protocol/ for the full thing,
+what's supported here is:
+
+* a=t (transmit), a=T (transmit and display), a=p (display an image
+  transmitted before), a=d (delete, d=a/A or d=i/I), a=q (query)
+* f=24 (RGB), f=32 (RGBA) and f=100 (PNG), o=z (zlib compressed)
+* t=d (data in the escape), split in chunks with m=1
+* i (image id), s/v (width/height in pixels), c/r (columns/rows to
+  scale it to), q (quiet)
+
+Decoding and uploading an image costs a lot more than drawing it, so
+textures are cached by a hash of their data and shared by all
+terminals: showing the same image again, from whatever program, is free.
+"""
+
+import base64
+import hashlib
+import tempfile
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from cobra_py import rl
+from cobra_py.raylib import ffi
+
+_BYTES_PER_PIXEL = {24: 3, 32: 4}
+# Keys whose value is a letter, all others are numbers
+_LETTER_KEYS = set("adot")
+
+
+class GraphicsError(Exception):
+    """Something wrong with a graphics command.
+
+    The message starts with the error code kitty would use, and is
+    what gets reported back to the program.
+    """
+
+
+def parse_command(payload: bytes):
+    """Split the inside of an APC G sequence into (controls, data).
+
+    controls is a dict, with numbers already converted to int.
+    data is the base64 decoded payload.
+    """
+    head, _, data = payload.partition(b";")
+    controls = {}
+    for item in head.decode("ascii", "replace").split(","):
+        key, _, value = item.partition("=")
+        if not key:
+            continue
+        if key in _LETTER_KEYS:
+            if len(value) != 1 or not value.isalpha():
+                raise GraphicsError(f"EINVAL:bad value for {key}")
+            controls[key] = value
+            continue
+        try:
+            controls[key] = int(value)
+        except ValueError:
+            raise GraphicsError(f"EINVAL:bad value for {key}")
+    try:
+        data = base64.b64decode(data)
+    except ValueError:
+        raise GraphicsError("EINVAL:bad base64 data")
+    return controls, data
+
+
+def _decompress(data, limit):
+    """Undo o=z compression, refusing to make more than limit bytes."""
+    decompressor = zlib.decompressobj()
+    try:
+        # One more than allowed, to tell too much from just enough
+        data = decompressor.decompress(data, limit + 1)
+    except zlib.error:
+        raise GraphicsError("EINVAL:bad zlib data")
+    if len(data) > limit or decompressor.unconsumed_tail:
+        raise GraphicsError("EFBIG:image too big")
+    return data
+
+
+def decode(controls, data, max_bytes):
+    """Turn the transmitted data into a raylib Image.
+
+    :max_bytes: most a PNG can take decompressed. Raw pixels can't take
+        more than their size says.
+    """
+    fmt = controls.get("f", 32)
+    if fmt == 100:
+        if controls.get("o") == "z":
+            data = _decompress(data, max_bytes)
+        # raylib 3.0 can only load images from files
+        with tempfile.NamedTemporaryFile(suffix=".png") as png:
+            png.write(data)
+            png.flush()
+            image = rl.load_image(png.name)
+        if image.data == ffi.NULL:
+            raise GraphicsError("EBADPNG:can't decode PNG")
+        return image
+    if fmt not in _BYTES_PER_PIXEL:
+        raise GraphicsError(f"EINVAL:unsupported format {fmt}")
+    width = controls.get("s", 0)
+    height = controls.get("v", 0)
+    size = width * height * _BYTES_PER_PIXEL[fmt]
+    if controls.get("o") == "z" and size > 0:
+        data = _decompress(data, size)
+    if len(data) != size or not data:
+        raise GraphicsError("ENODATA:size doesn't match the data")
+    # Copied by LoadImagePro, so data can go away after this
+    return rl.load_image_pro(
+        ffi.from_buffer(data),
+        width,
+        height,
+        rl.UNCOMPRESSED_R8G8B8 if fmt == 24 else rl.UNCOMPRESSED_R8G8B8A8,
+    )
+
+
+@dataclass
+class Placement:
+    """An image shown in a terminal, its top left corner at cell x, y."""
+
+    key: str
+    texture: Any
+    image_id: int
+    x: int
+    y: int
+    width: float
+    height: float
+
+
+class ImageCache:
+    """Textures for inline images, keyed by a hash of what was transmitted.
+
+    Each texture counts how many users it has (get adds one, release
+    takes it back). The last `keep` textures nobody uses anymore are
+    kept around, in case the same image comes back, older ones are
+    unloaded.
+    """
+
+    def __init__(self, keep=32):
+        self.keep = keep
+        self.textures = {}  # key -> texture
+        self._users = {}  # key -> count, only for textures in use
+        self._unused = OrderedDict()  # Oldest first
+
+    def get(self, controls, data, max_bytes):
+        """Return (key, texture) for an image, decoding it if it's new.
+
+        :max_bytes: see decode.
+        """
+        digest = hashlib.sha1(data)
+        for name in "fosv":
+            digest.update(str(controls.get(name)).encode())
+        key = digest.hexdigest()
+        if key not in self.textures:
+            image = decode(controls, data, max_bytes)
+            self.textures[key] = rl.load_texture_from_image(image)
+            rl.unload_image(image)
+        self.use(key)
+        return key, self.textures[key]
+
+    def use(self, key):
+        """Add a user to a texture get returned before."""
+        self._unused.pop(key, None)
+        self._users[key] = self._users.get(key, 0) + 1
+
+    def release(self, key):
+        self._users[key] -= 1
+        if self._users[key]:
+            return
+        del self._users[key]
+        self._unused[key] = None
+        while len(self._unused) > self.keep:
+            old, _ = self._unused.popitem(last=False)
+            rl.unload_texture(self.textures.pop(old))
@@ -28,6 +28,7 @@ _special_keys = {
     "0xff57": (b"\x1b[F", b"\x1b[1;2F"),  # End
     "0xff55": (b"\x1b[5~", b"\x1b[5;2~"),  # PgUp
     "0xff56": (b"\x1b[6~", b"\x1b[6;2~"),  # PgDn
+    "0xff63": (b"\x1b[2~", b"\x1b[2;2~"),  # Insert
 }
 
 
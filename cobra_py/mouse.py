@@ -0,0 +1,72 @@
+"""Turn raylib's mouse state into events a terminal can report."""
+
+from collections import namedtuple
+
+from cobra_py import rl
+
+# kind is one of PRESS, RELEASE, MOTION. button is as xterm numbers them:
+# 0 left, 1 middle, 2 right, 64 wheel up, 65 wheel down, None for
+# motion with no button pressed. x and y are cell coordinates.
+MouseEvent = namedtuple("MouseEvent", "kind button x y")
+PRESS = "press"
+RELEASE = "release"
+MOTION = "motion"
+
+# (xterm button number, raylib button)
+_BUTTONS = (
+    (0, rl.MOUSE_LEFT_BUTTON),
+    (1, rl.MOUSE_MIDDLE_BUTTON),
+    (2, rl.MOUSE_RIGHT_BUTTON),
+)
+_WHEEL_UP = 64
+_WHEEL_DOWN = 65
+
+
+class Mouse:
+    """Tracks the mouse over a grid of cells, and says what changed.
+
+    raylib only lets us look at the mouse state, so poll() is meant to
+    be called once per frame and returns what happened since the last
+    call as a list of MouseEvents. However much the mouse moved during
+    the frame, that is at most one MOTION event, and only if it ended
+    up over a different cell. The first call after position is set to
+    None only takes note of where the mouse is.
+
+    x, y is where the top left corner of the grid is in the window.
+    """
+
+    x = 0
+    y = 0
+
+    def __init__(self, cell_width, cell_height, columns, lines):
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.columns = columns
+        self.lines = lines
+        self.position = None  # Cell the mouse was over, last time
+        self.pressed = []  # Buttons held down, oldest first
+
+    def poll(self):
+        x = (rl.get_mouse_x() - self.x) // self.cell_width
+        y = (rl.get_mouse_y() - self.y) // self.cell_height
+        x = min(max(int(x), 0), self.columns - 1)
+        y = min(max(int(y), 0), self.lines - 1)
+        events = []
+        if self.position is None:
+            self.position = (x, y)
+        elif (x, y) != self.position:
+            self.position = (x, y)
+            button = self.pressed[0] if self.pressed else None
+            events.append(MouseEvent(MOTION, button, x, y))
+        for button, rl_button in _BUTTONS:
+            if rl.is_mouse_button_pressed(rl_button):
+                self.pressed.append(button)
+                events.append(MouseEvent(PRESS, button, x, y))
+            elif button in self.pressed and rl.is_mouse_button_released(rl_button):
+                self.pressed.remove(button)
+                events.append(MouseEvent(RELEASE, button, x, y))
+        wheel = rl.get_mouse_wheel_move()
+        if wheel:
+            button = _WHEEL_UP if wheel > 0 else _WHEEL_DOWN
+            events.extend([MouseEvent(PRESS, button, x, y)] * abs(wheel))
+        return events
@@ -0,0 +1,81 @@
+"""Where the time of each frame goes.
+
+Screen times every part of a frame into its Profiler:
+
+* each layer's update, by its profile_name, on frames when it's updated
+* "compose": drawing all layers to the window
+* "swap": EndDrawing, showing the frame and waiting for vsync
+* "wait": waiting for something to happen, when there's nothing to show
+* "frame": the whole thing
+
+Each keeps the last few seconds of samples, so ProfilerLayer (see
+profiler_layer.py) can show their percentiles while running. To look at them afterwards, dump_on
+writes them as JSON when the program exits, and whenever it gets a
+signal (SIGUSR1 by default):
+
+    kill -USR1 <pid>
+"""
+
+import atexit
+import json
+import signal
+from collections import deque
+
+
+class Samples:
+    """The last size durations of something, in seconds."""
+
+    def __init__(self, size=600):
+        self.samples = deque(maxlen=size)
+        self.count = 0  # Ever recorded, not just kept
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def percentiles(self, *ps):
+        """The given percentiles (0-100) of the samples kept, in seconds."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0] * len(ps)
+        last = len(ordered) - 1
+        return [ordered[round(p / 100 * last)] for p in ps]
+
+
+class Profiler:
+    """Rolling samples of how long each part of a frame takes, by name."""
+
+    def __init__(self, size=600):
+        self.size = size
+        self.sections = {}  # Name -> Samples, in the order first seen
+
+    def add(self, name, seconds):
+        try:
+            self.sections[name].add(seconds)
+        except KeyError:
+            samples = self.sections[name] = Samples(self.size)
+            samples.add(seconds)
+
+    def stats(self):
+        """Name -> dict with count and p50/p95/p99/max in milliseconds."""
+        stats = {}
+        for name, samples in self.sections.items():
+            p50, p95, p99, top = samples.percentiles(50, 95, 99, 100)
+            stats[name] = dict(
+                count=samples.count,
+                p50_ms=p50 * 1000,
+                p95_ms=p95 * 1000,
+                p99_ms=p99 * 1000,
+                max_ms=top * 1000,
+            )
+        return stats
+
+    def dump(self, path):
+        with open(path, "w") as outf:
+            json.dump(self.stats(), outf, indent=2)
+
+    def dump_on(self, path, signals=(signal.SIGUSR1,)):
+        """Dump to path when the program exits, and on each of signals."""
+        atexit.register(self.dump, path)
+        for signum in signals:
+            signal.signal(signum, lambda *_: self.dump(path))
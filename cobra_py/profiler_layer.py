@@ -0,0 +1,65 @@
+"""Show where the time of each frame goes, see profiler.py."""
+
+import time
+
+from cobra_py import rl
+
+
+class ProfilerLayer(rl.Layer):
+    """Shows the screen's profiler percentiles, in place of an FPS counter.
+
+    It's a layer like any other, make it after the others so it's on
+    top. The numbers change update_rate times a second.
+
+    FPS is how many frames were shown in the last of those. Screen
+    doesn't compose frames when nothing changed, so it's low on an idle
+    screen. The timing of frames it didn't compose is in "wait".
+    """
+
+    update_rate = 2
+    has_texture = False
+    color = (0, 255, 0, 255)
+    background = (0, 0, 0, 160)
+
+    def __init__(self, screen, enabled=True, position=(10, 10)):
+        super().__init__(screen, enabled=enabled, position=position)
+        # The screen's, another atlas would be another texture
+        self.glyphs = screen.glyphs
+        self.lines = []
+        self._shown = 0  # Frames composed, as of the last update
+        self._since = None  # When that was
+
+    def _fps(self, stats):
+        """Frames composed per second since the last call, None the first time."""
+        shown = stats.get("compose", {}).get("count", 0)
+        now = time.perf_counter()
+        fps = None
+        if self._since is not None and now > self._since:
+            fps = (shown - self._shown) / (now - self._since)
+        self._shown, self._since = shown, now
+        return fps
+
+    def update(self):
+        stats = self._screen.profiler.stats()
+        fps = self._fps(stats)
+        lines = [
+            f"{fps:5.1f} FPS" if fps is not None else "",
+            f"{'':16} {'p50':>6} {'p95':>6} {'p99':>6} ms",
+        ]
+        for name, section in stats.items():
+            lines.append(
+                f"{name[:16]:16} {section['p50_ms']:6.2f} "
+                f"{section['p95_ms']:6.2f} {section['p99_ms']:6.2f}"
+            )
+        if lines != self.lines:
+            self.lines = lines
+            self.damaged = True
+
+    def draw_overlay(self):
+        if not self.lines:
+            return
+        h = self.glyphs.cell_height
+        width = max(len(line) for line in self.lines) * self.glyphs.cell_width
+        rl.draw_rectangle(0, 0, width, len(self.lines) * h, self.background)
+        for i, line in enumerate(self.lines):
+            self.glyphs.draw_text(line, (0, i * h), self.color)
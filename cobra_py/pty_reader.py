@@ -0,0 +1,87 @@
+"""Read a pty in a background thread."""
+
+import os
+import threading
+
+
+class PtyReader:
+    """Reads everything a pty outputs into a ring buffer, in a thread.
+
+    Data is read straight into a preallocated buffer, and handed to the
+    consumer as memoryviews of it, so the reader itself never copies it.
+    What the consumer does with it is up to the consumer: TerminalStream
+    makes one bytes copy of each chunk.
+
+    When the buffer is full the thread stops reading until the consumer
+    catches up, so the child process blocks writing to the pty instead
+    of us dropping data or using unbounded memory.
+
+    The consumer side is meant to be used like this::
+
+        chunk = reader.peek(4096)
+        do_something(chunk)
+        reader.consume(len(chunk))
+    """
+
+    eof = False
+
+    def __init__(self, fd: int, size: int = 1 << 20, wake=None):
+        """Create a reader for fd.
+
+        :wake: called from the reading thread whenever data arrives,
+               for a consumer that sleeps while there's nothing to do.
+        """
+        self.fd = fd
+        self.size = size
+        self.wake = wake
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        # Total bytes ever read and consumed, positions are these modulo size
+        self._head = 0
+        self._tail = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def __len__(self):
+        """How many bytes are waiting to be consumed."""
+        return self._tail - self._head
+
+    def _run(self):
+        size = self.size
+        while True:
+            with self._cond:
+                while self._tail - self._head >= size:
+                    self._cond.wait()
+                free = size - (self._tail - self._head)
+            start = self._tail % size
+            end = start + min(free, size - start)
+            try:
+                count = os.readv(self.fd, [self._view[start:end]])
+            except OSError:  # Program went away
+                count = 0
+            if not count:
+                self.eof = True
+                return
+            with self._cond:
+                self._tail += count
+            if self.wake is not None:
+                self.wake()
+
+    def peek(self, limit: int) -> memoryview:
+        """Return up to limit bytes of pending data, without consuming it.
+
+        May return less than what is pending when the data wraps around
+        the end of the buffer, the rest will come on the next call.
+        """
+        start = self._head % self.size
+        end = start + min(self._tail - self._head, self.size - start, limit)
+        return self._view[start:end]
+
+    def consume(self, count: int):
+        """Mark count bytes, previously returned by peek, as used."""
+        with self._cond:
+            self._head += count
+            self._cond.notify()
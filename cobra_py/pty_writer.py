@@ -0,0 +1,55 @@
+"""Write to a pty in a background thread."""
+
+import os
+import threading
+
+
+class PtyWriter:
+    """Writes data to a pty in a thread, so writing never blocks the caller.
+
+    write() just queues the data. The thread writes it to the pty in
+    chunks of up to `chunk` bytes, and when the program is not reading
+    its input and the pty fills up, it's the thread that blocks.
+
+    len() of it is how much is still waiting to be written, so whoever
+    has a lot to send (like a big paste) can hold back until the program
+    catches up instead of queueing it all at once.
+    """
+
+    closed = False
+
+    def __init__(self, fd: int, chunk: int = 4096):
+        self.fd = fd
+        self.chunk = chunk
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def __len__(self):
+        """How many bytes are waiting to be written."""
+        return len(self._buffer)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer:
+                    self._cond.wait()
+                data = bytes(self._buffer[: self.chunk])
+            try:
+                count = os.write(self.fd, data)
+            except OSError:  # Program went away
+                self.closed = True
+                return
+            with self._cond:
+                del self._buffer[:count]
+
+    def write(self, data: bytes):
+        """Queue data to be written."""
+        if self.closed:
+            return
+        with self._cond:
+            self._buffer += data
+            self._cond.notify()
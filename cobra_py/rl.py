@@ -1,14 +1,39 @@
 # type: ignore
-"""A wrapper to the raylib CFFI binding so that names are snake_case instead of CamelCase"""
-
-import inspect
+"""A wrapper to the raylib CFFI binding so that names are snake_case instead of CamelCase
+
+Everything in the binding is available here, as rl.init_window or
+rl.InitWindow. Names are looked up the first time they are used, in a
+table generated along with the binding (rl_names.py, see bind_raylib
+in tasks.py), so importing this doesn't go through all of raylib.
+The same table says which arguments are strings, so rl.init_window
+takes a str for the title, not just bytes. Without the table (it's not
+in git) names are found by going through the binding, and string
+arguments by looking at each function's type, which is slower but
+works the same.
+
+Every process that draws, or talks to something that does, imports
+this, so it has an import time budget: 5 ms, not counting the modules
+it imports (the binding itself, mostly). benchmarks/import_time.py
+checks it.
+"""
+
+import functools
 import re
+import time
 from pathlib import Path
-from types import BuiltinFunctionType
 
 import cobra_py.raylib.lib as rl
+from cobra_py.glyph_atlas import GlyphAtlas
+from cobra_py.profiler import Profiler
 from cobra_py.raylib import ffi
 
+try:
+    from cobra_py.rl_names import NAMES as _names
+    from cobra_py.rl_names import STRING_ARGS as _string_args
+except ImportError:  # Not generated, see _snake_case_names and _char_args
+    _names = None
+    _string_args = None
+
 
 def camel_to_snake(name):
     name = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", name)
@@ -17,29 +42,124 @@ def camel_to_snake(name):
 
 # In this file we **have** to use the CamelCase raylib identifiers, c'est la vie.
 
-# Doesn't work with CFFI functions (yet!) but hey, it's an idea
-def wrap_bytes(f):
+# Strings passed to raylib over and over (titles, labels, file names)
+# are only encoded once.
+_encoded = {}
+
+
+def _encode(text):
     try:
-        sig = inspect.signature(f)
-    except ValueError:
-        return f
-    byte_args = [
-        i for i, p in enumerate(sig.parameters) if sig.parameters[p].annotation == bytes
-    ]
-
-    def g(*a):
-        _a = list(a)
-        for i in byte_args:
-            _a[i] = _a[i].encode("utf-8")
-        f(*a)
+        return _encoded[text]
+    except KeyError:
+        data = text.encode("utf-8")
+        if len(text) <= 256:
+            if len(_encoded) > 1024:
+                _encoded.clear()
+            _encoded[text] = data
+        return data
+
+
+def accept_str(f, positions):
+    """Wrap raylib function f so the arguments at positions can be str.
+
+    They are passed on as UTF-8 bytes, which is what raylib wants for
+    const char *. Anything else is passed on as is.
+    """
+    if positions == (0,):  # Most of them, like DrawText
+
+        @functools.wraps(f)
+        def g(text, *args):
+            if text.__class__ is str:
+                text = _encode(text)
+            return f(text, *args)
+
+    else:
+
+        @functools.wraps(f)
+        def g(*args):
+            args = list(args)
+            for i in positions:
+                if i < len(args) and args[i].__class__ is str:
+                    args[i] = _encode(args[i])
+            return f(*args)
 
     return g
 
 
-for name, value in inspect.getmembers(rl):
-    if isinstance(value, BuiltinFunctionType):
-        locals()[camel_to_snake(name)] = wrap_bytes(value)
-    locals()[name] = value
+def _snake_case_names():
+    """snake_case name -> raylib name, for all raylib functions."""
+    global _names
+    if _names is None:
+        # Constants are all caps, everything else is a function
+        _names = {camel_to_snake(name): name for name in dir(rl) if not name.isupper()}
+    return _names
+
+
+def _char_args(f):
+    """Positions of f's char * arguments, for when there's no STRING_ARGS.
+
+    CFFI doesn't keep const, so this includes buffers raylib writes
+    to. Passing those a str is as useless as passing bytes, but not
+    any worse.
+    """
+    try:
+        args = ffi.typeof(f).args
+    except TypeError:  # Not a function
+        return ()
+    return tuple(i for i, arg in enumerate(args) if arg.cname == "char *")
+
+
+def __getattr__(name):
+    """Find name in raylib, the first time it's used from this module.
+
+    The snake_case version of functions with const char * arguments
+    accepts str for them, see accept_str. Everything else, including
+    the CamelCase name of the same function, is the CFFI object itself.
+    """
+    raylib_name = _snake_case_names().get(name)
+    try:
+        value = getattr(rl, raylib_name or name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    if raylib_name is not None:
+        if _string_args is None:
+            positions = _char_args(value)
+        else:
+            positions = _string_args.get(raylib_name)
+        if positions:
+            value = accept_str(value, positions)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_snake_case_names()) | set(dir(rl)))
+
+
+class TexturePool:
+    """Render textures, reused instead of unloaded and loaded again.
+
+    Layers get their textures from here, and give them back when they
+    don't need them for a while. The last keep textures given back are
+    kept for whoever asks for one of the same size next, older ones are
+    unloaded, so the memory is really freed.
+    """
+
+    def __init__(self, keep=1):
+        self.keep = keep
+        self._free = []  # Oldest first
+
+    def get(self, width, height):
+        """A render texture of width x height pixels, with whatever was in it."""
+        for i, target in enumerate(self._free):
+            if (target.texture.width, target.texture.height) == (width, height):
+                return self._free.pop(i)
+        return rl.LoadRenderTexture(width, height)
+
+    def release(self, target):
+        self._free.append(target)
+        while len(self._free) > self.keep:
+            rl.UnloadRenderTexture(self._free.pop(0))
 
 
 class Screen:
@@ -49,7 +169,18 @@ class Screen:
     Also, it has an "event loop" that will make all buffers update and display.
     """
 
-    show_fps = True
+    # Where to write the profiler's numbers as JSON, when run returns and
+    # on SIGUSR1, see profiler.py
+    profile_path = None
+    # Draws all layers in one pass instead of one each, see compositor.py
+    compositor = None
+    # Longest to wait for something to happen when there is nothing new to
+    # show, in seconds. None composes every frame no matter what. On the
+    # Pi nothing can cut the wait short (WakeUp does nothing there), so
+    # program output can take this long to show up.
+    idle_wait = 0.1
+    # Seconds per frame for updating layers, see update
+    update_budget = 0.012
     ctrl = False
     shift = False
     alt = False
@@ -59,10 +190,12 @@ class Screen:
         self.width = width
         self.height = height
         rl.InitWindow(width, height, b"CobraPy")
-        font_path = str(
-            Path(__file__).parent / "resources" / "fonts" / "monoid.ttf"
-        ).encode("utf-8")
-        self.font = rl.LoadFontEx(font_path, 24, ffi.NULL, 256)
+        self.resources = {}
+        self.textures = TexturePool()
+        self.profiler = Profiler()
+        # Shared by everything that draws text, see glyph_atlas.py
+        self.glyphs = self.glyph_atlas(24)
+        self.font = self.glyphs.font
         self.text_size = rl.MeasureTextEx(self.font, b"X", self.font.baseSize, 0)
         rl.SetTargetFPS(60)
 
@@ -71,38 +204,188 @@ class Screen:
         rl.SetKeyCallback(self.__cb)
 
         self.layers = []
+        self._composed = None  # Enabled layers, last time they were composed
+        self._deferred = []  # Layers that didn't fit in the last update budget
+        self._hidden_since = {}  # Disabled layer -> when it was first seen disabled
 
     def add_layer(self, layer):
         self.layers.append(layer)
 
+    def shared(self, key, factory):
+        """Return the resource known as key, calling factory() to make it the first time.
+
+        For things all layers can use the same one of, like fonts and the
+        keymap, so each layer doesn't pay for making its own.
+        """
+        try:
+            return self.resources[key]
+        except KeyError:
+            resource = self.resources[key] = factory()
+            return resource
+
+    def glyph_atlas(self, size):
+        """The bundled monoid font at size pixels, shared by all layers."""
+        return self.shared(
+            ("glyphs", size),
+            lambda: GlyphAtlas(
+                Path(__file__).parent / "resources" / "fonts" / "monoid.ttf", size
+            ),
+        )
+
+    def _wants_update(self, layer):
+        """Whether layer's update_policy says to update it this frame."""
+        policy = layer.update_policy
+        if policy == "visible":
+            return layer.enabled
+        if policy == "pending":
+            return layer.pending()
+        return True
+
+    def _next_update(self, layer):
+        """When layer's update_rate lets it be updated again."""
+        if not layer.update_rate:
+            return 0
+        return layer.last_update + 1 / layer.update_rate
+
     def update(self):
-        for layer in self.layers:
+        """Update the layers that are due, within update_budget.
+
+        A layer whose update_budget doesn't fit in what's left of the
+        frame's is deferred, and updated first next frame, so every layer
+        gets its turn. At least one layer is updated every frame.
+        """
+        start = time.perf_counter()
+        deferred = [layer for layer in self._deferred if layer in self.layers]
+        self._deferred = []
+        updated = False
+        for layer in deferred + [
+            layer for layer in self.layers if layer not in deferred
+        ]:
+            now = time.perf_counter()
+            if now < self._next_update(layer) or not self._wants_update(layer):
+                continue
+            if updated and now - start + layer.update_budget > self.update_budget:
+                self._deferred.append(layer)
+                continue
+            layer.last_update = now
             layer.update()
+            updated = True
+            self.profiler.add(layer.profile_name, time.perf_counter() - now)
+
+    def _idle_time(self):
+        """How long frame can wait before some layer is due for an update."""
+        if self._deferred:
+            return 0
+        wait = self.idle_wait
+        now = time.perf_counter()
+        for layer in self.layers:
+            if layer.update_rate and self._wants_update(layer):
+                wait = min(wait, max(0, self._next_update(layer) - now))
+        return wait
+
+    def compose(self):
+        """Draw all enabled layers to the window, in order."""
+        start = time.perf_counter()
+        rl.BeginDrawing()
+        rl.ClearBackground(rl.BLACK)
+        layers = [layer for layer in self.layers if layer.enabled]
+        if self.compositor is not None and self.compositor.draw(layers):
+            for layer in layers:
+                self._draw_overlay(layer)
+        else:
+            for layer in layers:
+                if layer.texture is not None:
+                    rl.DrawTextureRec(
+                        layer.texture.texture,
+                        (
+                            0,
+                            0,
+                            layer.texture.texture.width,
+                            -layer.texture.texture.height,
+                        ),
+                        (layer.x, layer.y),
+                        rl.WHITE,
+                    )
+                self._draw_overlay(layer)
+        swap = time.perf_counter()
+        self.profiler.add("compose", swap - start)
+        rl.EndDrawing()
+        self.profiler.add("swap", time.perf_counter() - swap)
+
+    def _draw_overlay(self, layer):
+        if layer.x or layer.y:
+            # Overlays draw in layer coordinates too
+            rl.BeginMode2D(((layer.x, layer.y), (0, 0), 0, 1))
+            layer.draw_overlay()
+            rl.EndMode2D()
+        else:
+            layer.draw_overlay()
+
+    def frame(self):
+        """Update all layers, then show them if anything changed.
+
+        When no enabled layer is damaged and the same ones are enabled as
+        last time, the window already shows what they would draw, so
+        instead of composing it all again this waits, up to idle_wait
+        seconds, for input or for a layer to wake it up. It never waits
+        past when a layer with an update_rate is due again.
+
+        Waking up only works where raylib uses glfw. On the Pi the wait
+        always lasts idle_wait, unless there's input.
+        """
+        start = time.perf_counter()
+        self._manage_textures()
+        self.update()
+        enabled = [layer for layer in self.layers if layer.enabled]
+        if (
+            self.idle_wait is None
+            or enabled != self._composed
+            or any(layer.damaged for layer in enabled)
+        ):
+            self.compose()
+            self._composed = enabled
+            for layer in enabled:
+                layer.damaged = False
+        else:
+            wait = time.perf_counter()
+            rl.WaitEvents(self._idle_time())
+            self.profiler.add("wait", time.perf_counter() - wait)
+        self.profiler.add("frame", time.perf_counter() - start)
+
+    def _manage_textures(self):
+        """Unload textures of layers hidden for long enough, reload those shown again."""
+        now = time.perf_counter()
+        # Built again each time, so layers shown or removed from the screen
+        # are forgotten
+        hidden = {}
+        for layer in self.layers:
+            if layer.enabled:
+                if layer.texture is None and layer.has_texture:
+                    layer.load_texture()
+                continue
+            hidden_since = hidden[layer] = self._hidden_since.get(layer, now)
+            if (
+                layer.texture is not None
+                and layer.release_after is not None
+                and now - hidden_since >= layer.release_after
+            ):
+                layer.unload_texture()
+        self._hidden_since = hidden
 
     def run(self):
+        """Show frames until the window is closed, then close the layers.
+
+        Layers that hold on to things beyond the window (processes, shared
+        memory) let go of them in a close method, if they have one.
+        """
+        if self.profile_path:
+            self.profiler.dump_on(self.profile_path)
         while not rl.WindowShouldClose():
-            self.update()
-            rl.BeginDrawing()
-            rl.ClearBackground(rl.BLACK)
-
-            # Draw all layers
-            for layer in self.layers:
-                if not layer.enabled:
-                    continue
-                rl.DrawTextureRec(
-                    layer.texture.texture,
-                    (
-                        0,
-                        0,
-                        layer.texture.texture.width,
-                        -layer.texture.texture.height,
-                    ),
-                    (0, 0),
-                    rl.WHITE,
-                )
-            if self.show_fps:
-                rl.DrawFPS(10, 10)
-            rl.EndDrawing()
+            self.frame()
+        for layer in self.layers:
+            close = getattr(layer, "close", None)
+            if close is not None:
+                close()
 
     def key_event(self, key, scancode, action, mods):
         """Process one keyboard event.
@@ -142,23 +425,94 @@ class Layer:
     """A class for 'things that draw in a buffer'
 
     Screen will compose these and display them.
+
+    Screen only composes when something changed, so a layer has to set
+    damaged whenever it draws into its texture, or anything that
+    draw_overlay draws changes. It's cleared once the layer is shown.
+
+    Screen calls update on the frames when update_policy says so:
+
+    * "frame": every frame
+    * "visible": every frame while the layer is enabled
+    * "pending": every frame when pending() says there's work to do
+
+    but no more than update_rate times a second, if set. update_budget
+    is how long update usually takes at most, Screen uses it to leave
+    layers for the next frame when they don't fit in this one.
+
+    A layer covers size pixels of the screen (all of it by default),
+    with its top left corner at position. It draws into texture, one
+    from the screen's TexturePool, which it gives back when it has been
+    disabled for release_after seconds. Before showing it again Screen
+    gets it a new one, and calls invalidate: whatever was drawn is gone,
+    and has to be drawn again. A layer made disabled with release_after
+    set gets no texture until it's first shown. So a layer that can't do
+    that, or that draws while disabled, should leave release_after as
+    None. Layers that only draw in draw_overlay set has_texture to False.
     """
 
     enabled: bool = True
-
-    def __init__(self, screen: Screen, enabled: bool = True):
+    damaged: bool = True
+    update_policy: str = "frame"
+    update_rate: float = None
+    update_budget: float = 0.002
+    # When update was last called, by time.perf_counter
+    last_update: float = 0.0
+    has_texture: bool = True
+    release_after: float = None
+    texture = None
+
+    def __init__(
+        self, screen: Screen, enabled: bool = True, size=None, position=(0, 0)
+    ):
+        # What the profiler calls its updates
+        self.profile_name = f"{type(self).__name__} {len(screen.layers)}"
         screen.add_layer(self)
-        self.texture = rl.LoadRenderTexture(screen.width, screen.height)
         self._screen = screen
+        self.x, self.y = position
+        self.width, self.height = size or (screen.width, screen.height)
         self.enabled = enabled
+        if self.has_texture and (enabled or self.release_after is None):
+            self._get_texture()
+
+    def _get_texture(self):
+        self.texture = self._screen.textures.get(self.width, self.height)
         rl.BeginTextureMode(self.texture)
         rl.ClearBackground((0, 0, 0, 0))
         rl.EndTextureMode()
+        self.damaged = True
+
+    def load_texture(self):
+        """Get a texture again, after unload_texture."""
+        self._get_texture()
+        self.invalidate()
+
+    def unload_texture(self):
+        """Give the texture back to the screen's pool."""
+        self._screen.textures.release(self.texture)
+        self.texture = None
+
+    def invalidate(self):
+        """Forget what was drawn, the texture is blank and needs drawing again."""
+        pass
 
     def update(self):
         """Update the contents of self.buffer as needed.
 
-        Try not to take too long.
+        Try not to take too long, see update_budget.
+        """
+        pass
+
+    def pending(self) -> bool:
+        """Whether there's something for update to do, for the "pending" policy."""
+        return True
+
+    def draw_overlay(self):
+        """Draw things that go on top of the layer's texture.
+
+        Called every frame while composing the screen, right after
+        drawing the texture, so it's for small things that change often,
+        like a cursor, that are not worth drawing into the texture.
         """
         pass
 
@@ -0,0 +1,247 @@
+"""Compact storage for terminal scrollback."""
+
+import bisect
+import sys
+from array import array
+
+from pyte.screens import Char, StaticDefaultDict
+
+# Codepoints above unicode's range point into the cluster table
+_CLUSTER_BASE = 0x110000
+# Lines are stored as native 32 bit integers
+_UTF32 = "utf-32-le" if sys.byteorder == "little" else "utf-32-be"
+
+
+def fold_case(text: str) -> str:
+    """text in lowercase, keeping one character for each character of text.
+
+    str.lower turns a few characters into two (like U+0130, I with a
+    dot), which would move every offset after them. Those are kept as
+    they are.
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join([c if len(c.lower()) != 1 else c.lower() for c in text])
+
+
+class Scrollback:
+    """Lines that scrolled off the top of a terminal, packed tight.
+
+    Pyte keeps lines as dicts of Char namedtuples, which is hundreds of
+    bytes per cell. Here each line is a single bytes object holding one
+    32-bit codepoint and one 16-bit style index per cell, where styles
+    (everything in a Char except the text) are interned in a table.
+    Trailing blanks are not stored.
+
+    Instead of a number of lines, the size is limited by memory: when
+    the lines stored, and their text in the search index, take more
+    than max_bytes, the oldest are dropped.
+
+    Lines are numbered from 0 (oldest) to len(scrollback) - 1 (newest),
+    and any of them can be read in constant time.
+
+    The text of every line is also added to a SearchIndex, see search.
+    """
+
+    def __init__(self, max_bytes: int = 4 << 20):
+        self.max_bytes = max_bytes
+        self.index = SearchIndex()
+        self.clear()
+
+    def clear(self):
+        self._lines = []
+        self._sizes = array("I")  # Bytes each line takes, with its index text
+        self._first = 0  # Lines before this in _lines were dropped
+        self.dropped = 0  # How many lines were dropped since the last clear
+        self.nbytes = 0
+        self.index.clear()
+        self._styles = [Char(" ")[1:]]
+        self._style_index = {self._styles[0]: 0}
+        # Cells with more than one codepoint (combining characters)
+        self._clusters = []
+        self._cluster_index = {}
+
+    def __len__(self):
+        return len(self._lines) - self._first
+
+    def _style(self, char):
+        style = char[1:]
+        try:
+            return self._style_index[style]
+        except KeyError:
+            if len(self._styles) > 0xFFFF:  # Out of indexes, lose the style
+                return 0
+            self._style_index[style] = len(self._styles)
+            self._styles.append(style)
+            return len(self._styles) - 1
+
+    def _codepoint(self, data):
+        if len(data) == 1:
+            return ord(data)
+        if not data:  # Stub after a wide character
+            return 0
+        try:
+            return self._cluster_index[data]
+        except KeyError:
+            code = self._cluster_index[data] = _CLUSTER_BASE + len(self._clusters)
+            self._clusters.append(data)
+            return code
+
+    def _data(self, code):
+        if code >= _CLUSTER_BASE:
+            return self._clusters[code - _CLUSTER_BASE]
+        return chr(code) if code else ""
+
+    def push(self, line, columns: int):
+        """Add line, a pyte screen line, as the newest one."""
+        chars = [line[x] for x in range(columns)]
+        data = [char.data for char in chars]
+        text = "".join(data)
+        style_index = self._style_index
+        styles = [style_index.get(char[1:]) for char in chars]
+        if None in styles:
+            styles = [self._style(char) for char in chars]
+
+        # Don't store trailing blanks
+        size = len(styles)
+        while size and styles[size - 1] == 0:
+            size -= 1
+        # The usual, one codepoint per cell. With as many codepoints as
+        # cells, a cell with more than one means another has none.
+        if len(text) == columns and "" not in data:
+            size = max(size, len(text.rstrip(" ")))
+            codes = text[:size].encode(_UTF32)
+        else:
+            codes = array("I", [self._codepoint(char.data) for char in chars])
+            last = columns
+            while last and codes[last - 1] == 32:
+                last -= 1
+            size = max(size, last)
+            codes = codes[:size].tobytes()
+
+        record = codes + array("H", styles[:size]).tobytes()
+        self._lines.append(record)
+        line_bytes = sys.getsizeof(record) + self.index.add(text.rstrip())
+        self._sizes.append(line_bytes)
+        self.nbytes += line_bytes
+        while self.nbytes > self.max_bytes and len(self):
+            self.nbytes -= self._sizes[self._first]
+            self._lines[self._first] = None
+            self._first += 1
+            self.dropped += 1
+        self.index.trim(self.dropped)
+        # Drop the references to dropped lines once in a while
+        first = self._first
+        if first > len(self._lines) // 2:
+            del self._lines[:first]
+            del self._sizes[:first]
+            self._first = 0
+
+    def _cells(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError("scrollback line out of range")
+        record = memoryview(self._lines[self._first + index])
+        split = len(record) // 6 * 4
+        return record[:split].cast("I"), record[split:].cast("H")
+
+    def line(self, index: int, default: Char) -> StaticDefaultDict:
+        """Line number index, as a pyte screen line.
+
+        :default: Char to use past the end of the stored line.
+        """
+        codes, styles = self._cells(index)
+        line = StaticDefaultDict(default)
+        for x, (code, style) in enumerate(zip(codes, styles)):
+            line[x] = Char(self._data(code), *self._styles[style])
+        return line
+
+    def text(self, index: int) -> str:
+        """The text in line number index, without trailing blanks."""
+        codes, _ = self._cells(index)
+        if self._clusters or 0 in codes:
+            return "".join(self._data(code) for code in codes)
+        return codes.tobytes().decode(_UTF32)
+
+    def search(self, query: str):
+        """Find query in the stored lines, ignoring case.
+
+        Yields (line number, offset in the line's text) for each match,
+        newest first.
+        """
+        dropped = self.dropped
+        for line, offset in self.index.search(query, dropped):
+            yield line - dropped, offset
+
+
+class SearchIndex:
+    """The text of many lines, arranged to be searched quickly.
+
+    Lines are lowercased (see fold_case) and joined into blocks of
+    block_lines lines, so a search is a few str.find calls over big
+    strings instead of a Python loop over every line.
+
+    Lines are numbered as they are added, starting from 0. Trimming
+    forgets whole blocks, so up to block_lines lines before the first
+    one asked for can stay around.
+    """
+
+    block_lines = 4096
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # (number of the first line, text, where each line starts in text)
+        self._blocks = []
+        self._pending = []  # Lines not in a block yet
+        self._pending_first = 0
+
+    def add(self, text: str) -> int:
+        """Add text as the newest line. Returns about how many bytes it takes."""
+        text = fold_case(text)
+        self._pending.append(text)
+        if len(self._pending) >= self.block_lines:
+            self._blocks.append(self._block(self._pending_first, self._pending))
+            self._pending_first += len(self._pending)
+            self._pending = []
+        # Plus where it starts, and the newline after it, in its block
+        return sys.getsizeof(text) + 5
+
+    @staticmethod
+    def _block(first, lines):
+        starts = array("I")
+        position = 0
+        for line in lines:
+            starts.append(position)
+            position += len(line) + 1
+        return first, "\n".join(lines), starts
+
+    def trim(self, first: int):
+        """Forget lines before line number first."""
+        while self._blocks:
+            start, _, starts = self._blocks[0]
+            if start + len(starts) > first:
+                break
+            self._blocks.pop(0)
+
+    def search(self, query: str, first: int = 0):
+        """Find query, ignoring case, in lines numbered first and later.
+
+        Yields (line number, offset in the line) for each match, newest first.
+        """
+        query = fold_case(query)
+        if not query or "\n" in query:
+            return
+        blocks = self._blocks + [self._block(self._pending_first, self._pending)]
+        for start, text, starts in reversed(blocks):
+            matches = []
+            position = text.find(query)
+            while position != -1:
+                i = bisect.bisect_right(starts, position) - 1
+                matches.append((start + i, position - starts[i]))
+                position = text.find(query, position + 1)
+            for line, offset in reversed(matches):
+                if line < first:
+                    return
+                yield line, offset
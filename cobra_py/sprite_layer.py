@@ -21,15 +21,22 @@ class SpriteLayer(rl.Layer):
     """A layer for named sprites.
 
     Sprites have image, size, position, rotation and so on.
+
+    They are drawn straight to the screen as an overlay, a few small
+    textures cost less than a screen sized one to put them in.
     """
 
+    update_policy = "visible"
+    has_texture = False
+
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
 
         self.sprites = {}
         self.textures = {}
+        self._drawn = None  # Where each sprite was, last time they were shown
 
-    def load_sprite(self, name: str, image: bytes):
+    def load_sprite(self, name: str, image: str):
         """Load image, create a sprite, call it name.
 
         If the name is already in use, then the new image is loaded in that sprite.
@@ -53,9 +60,12 @@ class SpriteLayer(rl.Layer):
         return rl.check_collision_recs(s1.rect(), s2.rect())
 
     def update(self):
-        rl.begin_texture_mode(self.texture)
-        rl.clear_background((0, 0, 0, 0))
+        drawn = [(s.x, s.y, id(s.texture)) for s in self.sprites.values()]
+        if drawn == self._drawn:
+            return
+        self._drawn = drawn
+        self.damaged = True
+
+    def draw_overlay(self):
         for sprite in self.sprites.values():
             rl.draw_texture(sprite.texture, sprite.x, sprite.y, rl.WHITE)
-
-        rl.end_texture_mode()
@@ -1,16 +1,26 @@
+import math
 import os
 import pty
-import select
+import re
 import shlex
 import shutil
+import time
 
 import pyte
 
 from cobra_py import rl
+from cobra_py.cell_shader import CellGrid
+from cobra_py.colors import ColorCache
+from cobra_py.fast_screen import FastScreen
+from cobra_py.inline_images import GraphicsError, ImageCache, Placement, parse_command
 from cobra_py.kbd_layout import read_xmodmap
+from cobra_py.mouse import MOTION, RELEASE, Mouse
+from cobra_py.pty_reader import PtyReader
+from cobra_py.pty_writer import PtyWriter
+from cobra_py.raylib import ffi
+from cobra_py.scrollback import Scrollback, fold_case
 
 # TODO:
-# * mouse support
 # * generalize keyboard support for screens/layers
 
 # Codes for ctrl+keys
@@ -22,66 +32,256 @@ def ctrl_key(char: bytes):
     return char
 
 
-# Color palette
-_colors = {
-    "black": rl.BLACK,
-    "red": rl.RED,
-    "green": rl.GREEN,
-    "brown": rl.BROWN,
-    "blue": rl.BLUE,
-    "magenta": rl.MAGENTA,
-    "cyan": (0, 255, 255, 255),
-    "white": rl.WHITE,
+# Keys to scroll through the history, as translated by kbd_layout
+_SHIFT_PGUP = b"\x1b[5;2~"
+_SHIFT_PGDN = b"\x1b[6;2~"
+# Key to paste the clipboard
+_SHIFT_INSERT = b"\x1b[2;2~"
+
+# Pyte keeps private modes shifted, see pyte.Screen.set_mode
+_BRACKETED_PASTE = 2004 << 5
+_PASTE_START = b"\x1b[200~"
+_PASTE_END = b"\x1b[201~"
+
+# Mouse reporting modes a program can ask for, most verbose first:
+# any motion, motion while a button is down, press and release, press.
+_MOUSE_MODES = (1003, 1002, 1000, 9)
+# Report the mouse as CSI < ... M/m instead of packing it into bytes
+_MOUSE_SGR = 1006 << 5
+
+# DECSCUSR cursor styles, as (shape, blink)
+_CURSOR_STYLES = {
+    1: ("block", True),
+    2: ("block", False),
+    3: ("underline", True),
+    4: ("underline", False),
+    5: ("bar", True),
+    6: ("bar", False),
 }
-
-
-def parse_color(rgb):
-    r = int(rgb[:2], 16)
-    g = int(rgb[2:4], 16)
-    b = int(rgb[4:6], 16)
-    color = (r, g, b, 255)
-    return color
-
-
-class Terminal(pyte.HistoryScreen, rl.Layer):
+_CURSOR_COLOR = (255, 255, 255, 100)
+
+# Application program commands, pyte doesn't know about them
+_APC = b"\x1b_"
+_ST = b"\x1b\\"
+# What ends one: ST, or CAN and SUB, which cancel it like in xterm
+_APC_END = re.compile(rb"\x1b\\|[\x18\x1a]")
+# CSI > ... sequences, like xterm's modifyOtherKeys (CSI > 4 ; 2 m).
+# Pyte drops the >, which turns them into other sequences.
+_CSI_GT = re.compile(rb"\x1b\[>[0-9;]*[@-~]")
+# The start of an APC or CSI > sequence, at the end of what was read
+_PARTIAL = re.compile(rb"\x1b(\[(>[0-9;]*)?)?\Z")
+
+
+class TerminalStream(pyte.ByteStream):
+    """A ByteStream that also passes on DECSCUSR and graphics commands.
+
+    Pyte skips the space in CSI Ps SP q, so it arrives as CSI Ps q.
+
+    Pyte doesn't parse APC sequences at all, and would show what's in
+    them as text, so they are taken out before pyte sees them. The ones
+    starting with G are kitty graphics commands, and go to the listener's
+    graphics_command, the rest are ignored. So are CSI > sequences, which
+    pyte would take for the same sequence without the >.
+
+    An APC sequence longer than max_apc is dropped, what's left of it
+    skipped until its end, so a stray ESC _ can't take all memory.
+    """
+
+    csi = dict(pyte.ByteStream.csi, q="set_cursor_style")
+    # Kitty sends images in chunks of 4096 bytes, this is plenty
+    max_apc = 1 << 20
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._apc = None  # What we have of the APC sequence being read
+        self._apc_dropped = False  # It was too long, skipping to its end
+        self._tail = b""  # What may be the start of an APC, ST or CSI >
+
+    def feed(self, data: bytes):
+        # A memoryview from PtyReader, copied here once to split it up
+        data = self._tail + data if self._tail else bytes(data)
+        self._tail = b""
+        while data:
+            if self._apc is None:
+                text, start, data = data.partition(_APC)
+                if not start:
+                    partial = _PARTIAL.search(text)
+                    if partial:
+                        cut = partial.start()
+                        text, self._tail = text[:cut], text[cut:]
+                super().feed(_CSI_GT.sub(b"", text))
+                if start:
+                    self._apc = bytearray()
+            else:
+                end = _APC_END.search(data)
+                if end:
+                    cut, rest = end.span()
+                    apc, data = data[:cut], data[rest:]
+                else:
+                    apc, data = data, b""
+                    if apc.endswith(b"\x1b"):
+                        apc, self._tail = apc[:-1], apc[-1:]
+                if not self._apc_dropped:
+                    self._apc += apc
+                    if len(self._apc) > self.max_apc:
+                        self._apc.clear()
+                        self._apc_dropped = True
+                if not end:
+                    return
+                apc, self._apc = self._apc, None
+                dropped, self._apc_dropped = self._apc_dropped, False
+                if end.group() == _ST and not dropped and apc.startswith(b"G"):
+                    self.listener.graphics_command(bytes(apc[1:]))
+
+
+class Terminal(FastScreen, rl.Layer):
     """A simple terminal with a graphical interface implemented using Raylib."""
 
     ctrl = False
     shift = False
     alt = False
     alt_gr = False
-    mouse_pressed = False
-    p_out = None
-    last_cursor = (-1, -1)
-
-    # Ideally this should change when we get the SGR switch escape sequence
-    # but Pyte doesn't support that yet
-    mouse_enabled = False
-
-    def __init__(self, screen: rl.Screen, enabled: bool = True, cmd: str = "bash"):
+    reader = None
+    writer = None
+    cells_examined = 0
+    cells_drawn = 0
+
+    # Draw runs of cells sharing colors with one call each, instead
+    # of one rectangle and one text call per cell
+    coalesce_runs = True
+    # Draw the whole terminal with one quad and a shader instead, see
+    # cell_shader.py. Needs a GPU that can do 2048x2048 textures.
+    use_shader = False
+    _cells = None
+
+    # Seconds per frame we are willing to spend parsing program output,
+    # whatever doesn't fit waits for the next frame.
+    feed_budget = 0.005
+    # Parsing, and then drawing what changed
+    update_budget = 0.008
+    # Hidden terminals only update to keep their program's output flowing
+    update_policy = "pending"
+    # Everything can be drawn again from the screen, see rl.Layer
+    release_after = 30
+    # How much program output to feed pyte at once
+    feed_chunk = 16384
+    # How much program output can be waiting to be parsed, after that
+    # the program blocks until we catch up.
+    read_buffer_size = 1 << 20
+    # How much input (keys, pastes) to hand to the program per frame,
+    # at most. If it has not read the previous batch yet, it gets nothing.
+    input_chunk = 16384
+    # How much memory lines that scrolled off the screen can use
+    scrollback_bytes = 4 << 20
+    # How many lines back into the history we are looking at
+    view_offset = 0
+    # Text being searched for, highlighted wherever it's visible
+    search_query = None
+    _matches = iter(())
+    _found = []
+    _match = -1
+
+    # How the cursor looks unless the program says otherwise: "block",
+    # "underline" or "bar", and whether it blinks, every this many seconds.
+    cursor_shape = "block"
+    cursor_blink = False
+    cursor_blink_rate = 0.5
+
+    # Whether programs that ask for mouse reports get them
+    mouse_enabled = True
+    # Mouse reporting mode the program asked for (see _MOUSE_MODES), or None
+    mouse_mode = None
+
+    # What draw_overlay last drew, see _check_overlay
+    _overlay = None
+
+    # Most data a program can send for one inline image, before decoding,
+    # and after decompressing it
+    max_image_bytes = 64 << 20
+    # [controls, chunks, their total size] of an image being sent in chunks
+    _image_chunks = None
+
+    def __init__(
+        self,
+        screen: rl.Screen,
+        enabled: bool = True,
+        cmd: str = "bash",
+        size=None,
+        position=(0, 0),
+    ):
         """Create terminal.
 
-        :cmd: command to run in the terminal.
+        :cmd: command to run in the terminal, or None to only display
+              what is fed into self.stream.
+        :size: size in pixels, as many cells as fit. The whole screen
+               by default.
+        :position: where its top left corner is on the screen.
         """
 
-        rl.Layer.__init__(self, screen, enabled=enabled)
+        rl.Layer.__init__(self, screen, enabled=enabled, size=size, position=position)
         self.text_size = screen.text_size
-        self.font = screen.font
-        self.rows = int(self._screen.height // self.text_size.y)
-        self.columns = int(self._screen.width // self.text_size.x)
-        pyte.HistoryScreen.__init__(self, self.columns, self.rows)
+        self.glyphs = screen.glyphs
+        self.rows = int(self.height // self.text_size.y)
+        self.columns = int(self.width // self.text_size.x)
+        self.colors = screen.shared("colors", ColorCache)
+        self.images = screen.shared("images", ImageCache)
+        self.placements = []  # Inline images on screen, see inline_images.py
+        self._image_ids = {}  # Image id -> key in images
+        self._scrolls = []
+        self.history = Scrollback(self.scrollback_bytes)
+        self._input = bytearray()
+        FastScreen.__init__(self, self.columns, self.rows)
+        self.mouse = Mouse(self.text_size.x, self.text_size.y, self.columns, self.lines)
+        self.mouse.x, self.mouse.y = position
+        self.invalidate()
         self._init_kbd()
-        self._spawn_shell(cmd)
+        self.stream = TerminalStream(self)
+        if cmd is not None:
+            self._spawn_shell(cmd)
 
     def _init_kbd(self):
-        self.keymap = read_xmodmap()
+        self.keymap = self._screen.shared("keymap", read_xmodmap)
 
     def write_process_input(self, data):
-        if self.p_out is not None:
-            self.p_out.write(data.encode("utf-8"))
+        self.send(data.encode("utf-8"))
+
+    def send(self, data: bytes):
+        """Queue data to be written to the program, on the next update."""
+        if self.writer is not None:
+            self._input += data
+
+    def paste(self, text):
+        """Send text to the program as if typed, but all at once.
+
+        If the program asked for bracketed paste it's wrapped in the escape
+        sequences that mark it as a paste, so a REPL or editor can take it
+        in one go instead of running each line as it comes.
+        """
+        if self.view_offset:
+            self.scroll_view(-self.view_offset)
+        # Like xterm, newlines go as the Enter key does
+        data = text.replace("\r\n", "\r").replace("\n", "\r").encode("utf-8")
+        if _BRACKETED_PASTE in self.mode:
+            # Don't let the text end the paste early. Removing one end
+            # marker can join the bytes around it into another, so repeat.
+            while _PASTE_END in data:
+                data = data.replace(_PASTE_END, b"")
+            data = _PASTE_START + data + _PASTE_END
+        self.send(data)
+
+    def flush_input(self):
+        """Hand queued input to the program, up to input_chunk bytes.
+
+        Called once per frame, so all keys pressed in a frame are one
+        write, and a big paste is fed in pieces as the program reads them.
+        """
+        writer = self.writer
+        if writer is None or not self._input or len(writer) >= self.input_chunk:
+            return
+        writer.write(self._input[: self.input_chunk])
+        del self._input[: self.input_chunk]
 
     def _spawn_shell(self, cmd):
-        self.stream = pyte.ByteStream(self)
         cmd = shlex.split(cmd)
         cmd_path = shutil.which(cmd[0])
         p_pid, master_fd = pty.fork()
@@ -97,37 +297,427 @@ class Terminal(pyte.HistoryScreen, rl.Layer):
                     PATH="/usr/bin:/bin",
                 ),
             )
-        self.p_out = os.fdopen(master_fd, "w+b", 0)
+        self._start_io(master_fd)
+
+    def _start_io(self, fd):
+        """Start reading the program's output from the pty, and writing its input."""
+        # Output ends the Screen's wait for something to show
+        self.reader = PtyReader(fd, self.read_buffer_size, wake=rl.wake_up)
+        self.reader.start()
+        self.writer = PtyWriter(fd)
+        self.writer.start()
+
+    def resize(self, lines=None, columns=None):
+        super().resize(lines, columns)
+        self.mouse.columns = self.columns
+        self.mouse.lines = self.lines
+        if self._cells is not None:
+            self._cells.unload()
+            self._cells = None
+        self.invalidate()
+
+    def set_mode(self, *modes, **kwargs):
+        super().set_mode(*modes, **kwargs)
+        self._update_mouse_mode()
+
+    def reset_mode(self, *modes, **kwargs):
+        super().reset_mode(*modes, **kwargs)
+        self._update_mouse_mode()
+
+    def _update_mouse_mode(self):
+        mouse_mode = None
+        for mode in _MOUSE_MODES:
+            if mode << 5 in self.mode:
+                mouse_mode = mode
+                break
+        if mouse_mode != self.mouse_mode:
+            # Buttons released while not reporting are never seen released,
+            # and the mouse moved without anyone keeping track
+            self.mouse.pressed.clear()
+            self.mouse.position = None
+            self.mouse_mode = mouse_mode
+
+    # Scrolling. Pyte marks every row dirty when the screen scrolls, but
+    # almost everything that was drawn is still good, just in the wrong
+    # place, so we move it in the texture instead of drawing it again.
+
+    def index(self):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == bottom:
+            if top == 0:  # Lines scrolling out of a region are just lost
+                self.history.push(self.buffer[top], self.columns)
+            self._scroll(top, bottom, 1)
+            self._move_images(top, bottom, 1)
+        super().index()
+
+    def reverse_index(self):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == top:
+            self._scroll(top, bottom, -1)
+            self._move_images(top, bottom, -1)
+        super().reverse_index()
+
+    def insert_lines(self, count=None):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if top <= self.cursor.y <= bottom:
+            self._scroll(self.cursor.y, bottom, -(count or 1))
+            self._move_images(self.cursor.y, bottom, -(count or 1))
+        super().insert_lines(count)
+
+    def delete_lines(self, count=None):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if top <= self.cursor.y <= bottom:
+            self._scroll(self.cursor.y, bottom, count or 1)
+            self._move_images(self.cursor.y, bottom, count or 1)
+        super().delete_lines(count)
+
+    def reset(self):
+        super().reset()
+        self._update_mouse_mode()
+        self.set_cursor_style(0)
+        self.history.clear()
+        self.view_offset = 0
+        self.delete_images(forget=True)
+
+    def erase_in_display(self, how=0, *args, **kwargs):
+        super().erase_in_display(how, *args, **kwargs)
+        if how in (2, 3):
+            self.delete_images()
+        if how == 3:
+            self.history.clear()
+            self.view_offset = 0
+
+    def scroll_view(self, n):
+        """Move the view n lines back into the history (forward if n < 0)."""
+        offset = max(0, min(len(self.history), self.view_offset + n))
+        n = offset - self.view_offset
+        if not n:
+            return
+        self.view_offset = offset
+        self._scroll(0, self.lines - 1, -n)
+        self.dirty.update(range(self.lines))
+
+    def prev_page(self):
+        self.scroll_view(self.lines // 2)
+
+    def next_page(self):
+        self.scroll_view(-(self.lines // 2))
+
+    def visible_line(self, y):
+        """The line displayed in row y, taking the view offset and search into account.
+
+        Highlighting matches takes a while, so call this once per row
+        when drawing, and pass the line around.
+        """
+        offset = self.view_offset
+        if y >= offset:
+            line = self.buffer[y - offset]
+        else:
+            line = self.history.line(len(self.history) - offset + y, self.default_char)
+        if self.search_query:
+            line = self._highlight(line)
+        return line
+
+    def _highlight(self, line):
+        """Return a copy of line with matches of search_query in reverse video."""
+        query = self.search_query
+        cells = [line[x] for x in range(self.columns)]
+        columns = []  # Cell holding each character of text
+        for x, char in enumerate(cells):
+            columns.extend([x] * len(char.data))
+        text = fold_case("".join([char.data for char in cells]))
+        position = text.find(query)
+        if position == -1:
+            return line
+        line = pyte.screens.StaticDefaultDict(line.default)
+        line.update(enumerate(cells))
+        while position != -1:
+            first = columns[position]
+            last = columns[position + len(query) - 1]
+            for x in range(first, last + 1):
+                line[x] = line[x]._replace(reverse=not cells[x].reverse)
+            position = text.find(query, position + len(query))
+        return line
+
+    def search(self, query):
+        """Highlight query everywhere, and show its newest match in the history.
+
+        Case is ignored. Pass None to stop highlighting.
+        Returns whether query was found in the history.
+        """
+        self.search_query = fold_case(query) if query else None
+        self._matches = self.history.index.search(query or "", self.history.dropped)
+        self._found = []
+        self._match = -1
+        self.dirty.update(range(self.lines))
+        return self.search_next()
+
+    def search_next(self):
+        """Show the next older match in the history. Returns whether there was one."""
+        if self._match + 1 == len(self._found):
+            found = next(self._matches, None)
+            if found is None:
+                return False
+            self._found.append(found)
+        self._match += 1
+        self._show_history_line(self._found[self._match][0])
+        return True
+
+    def search_prev(self):
+        """Show the next newer match in the history. Returns whether there was one."""
+        if self._match <= 0:
+            return False
+        self._match -= 1
+        self._show_history_line(self._found[self._match][0])
+        return True
+
+    def _show_history_line(self, number):
+        """Scroll the view so history line number (as in history.index) is visible."""
+        index = number - self.history.dropped
+        if index < 0:  # Not in the history anymore
+            return
+        size = len(self.history)
+        offset = min(size, size - index + self.lines // 2)
+        self.scroll_view(offset - self.view_offset)
 
-    def set_margins(self, *args, **kwargs):
-        # See https://github.com/selectel/pyte/issues/67
-        kwargs.pop("private", None)
-        return super().set_margins(*args, **kwargs)
+    def _scroll(self, top, bottom, n):
+        """Record that rows top to bottom (inclusive) move up n rows (down if n < 0).
+
+        The shadow buffer is moved right away, and the texture when
+        rendering, so only the rows that scrolled in get drawn.
+        """
+        end = bottom + 1
+        height = end - top
+        shadow = self._shadow
+        blank = [[None] * self.columns for _ in range(min(abs(n), height))]
+        if n > 0:
+            kept = top + n
+            shadow[top:end] = shadow[kept:end] + blank
+        else:
+            kept = end + n
+            shadow[top:end] = blank + shadow[top:kept]
+
+        # Consecutive scrolls of the same region are one move
+        if self._scrolls and self._scrolls[-1][:2] == (top, bottom):
+            pending = self._scrolls[-1][2]
+            if (pending > 0) == (n > 0):
+                n += pending
+                self._scrolls.pop()
+        if abs(n) < height:  # Otherwise nothing survives, it's all drawn again
+            self._scrolls.append((top, bottom, n))
+
+    def _blit_scroll(self, top, bottom, n):
+        """Move the pixels of rows top to bottom (inclusive) up n rows (down if n < 0)."""
+        h = self.text_size.y
+        if n > 0:
+            src, dst = top + n, top
+        else:
+            src, dst = top, top - n
+        src_y = int(src * h)
+        dst_y = int(dst * h)
+        height = int((src + bottom - top + 1 - abs(n)) * h) - src_y
+        tex = self.texture.texture
+        # Render textures are upside down, so this is the source strip
+        # in texture coordinates, flipped.
+        strip = (0, tex.height - src_y - height, tex.width, -height)
+
+        # Can't draw a texture on itself, so go through a scratch one,
+        # from the pool, so all terminals of this size use the same one.
+        # Everything in the terminal is opaque, so blending doesn't matter.
+        scratch = self._screen.textures.get(tex.width, tex.height)
+        rl.begin_texture_mode(scratch)
+        rl.draw_texture_rec(tex, strip, (0, src_y), rl.WHITE)
+        rl.end_texture_mode()
+        rl.begin_texture_mode(self.texture)
+        rl.draw_texture_rec(scratch.texture, strip, (0, dst_y), rl.WHITE)
+        rl.end_texture_mode()
+        self._screen.textures.release(scratch)
 
     def mouse_event(self):
-        if not self.mouse_enabled:
+        """Report what the mouse did this frame, if the program asked for it."""
+        if not self.mouse_enabled or self.mouse_mode is None:
+            return
+        reports = [self._mouse_report(event) for event in self.mouse.poll()]
+        self.send(b"".join(report for report in reports if report))
+
+    def _mouse_report(self, event):
+        """Encode a MouseEvent as the program expects it, or None to not report it."""
+        mode = self.mouse_mode
+        kind, button, x, y = event
+        if kind == MOTION:
+            if mode == 1003 or (mode == 1002 and button is not None):
+                # Motion is reported as a press with 32 added
+                button = (3 if button is None else button) + 32
+            else:
+                return None
+        elif kind == RELEASE and (mode == 9 or button >= 64):
+            return None
+        if mode != 9:
+            screen = self._screen
+            button += 4 * screen.shift + 8 * screen.alt + 16 * screen.ctrl
+
+        if _MOUSE_SGR in self.mode:
+            final = "m" if kind == RELEASE else "M"
+            return f"\x1b[<{button};{x + 1};{y + 1}{final}".encode("utf-8")
+        # The old encoding doesn't say which button was released
+        if kind == RELEASE:
+            button = 3 | button & 28  # Keep the modifiers
+        if x > 222 or y > 222:  # Doesn't fit in a byte
+            return None
+        return bytes([27, 91, 77, 32 + button, 33 + x, 33 + y])
+
+    # Inline images, see inline_images.py
+
+    def graphics_command(self, payload: bytes):
+        """Run a kitty graphics command, payload is what came after APC G."""
+        controls = {}
+        try:
+            controls, data = parse_command(payload)
+            more = controls.get("m", 0) == 1
+            if self._image_chunks is not None:
+                # Only the first chunk has the controls that matter
+                first, chunks, size = self._image_chunks
+                chunks.append(data)
+                size = self._image_chunks[2] = size + len(data)
+                if size > self.max_image_bytes:
+                    self._image_chunks = None
+                    raise GraphicsError("EFBIG:image too big")
+                if more:
+                    return
+                self._image_chunks = None
+                controls = dict(first, q=controls.get("q", first.get("q", 0)))
+                data = b"".join(chunks)
+            elif more:
+                self._image_chunks = [controls, [data], len(data)]
+                return
+            self._graphics(controls, data)
+        except GraphicsError as err:
+            self._graphics_reply(controls, str(err))
+        else:
+            self._graphics_reply(controls, "OK")
+
+    def _graphics_reply(self, controls, message):
+        """Tell the program how a command went, if it wants to know."""
+        quiet = controls.get("q", 0)
+        if "i" not in controls or quiet == 2 or (quiet == 1 and message == "OK"):
             return
-        # See https://github.com/prompt-toolkit/python-prompt-toolkit/blob/master/prompt_toolkit/key_binding/bindings/mouse.py#L23
-        # For examples of decoding these events we are generating
-        x = int(rl.get_mouse_x() // self.text_size.x) + 1
-        y = int(rl.get_mouse_y() // self.text_size.y) + 1
+        self.send(f"\x1b_Gi={controls['i']};{message}\x1b\\".encode())
 
-        if rl.is_mouse_button_pressed(rl.MOUSE_LEFT_BUTTON):
-            self.mouse_pressed = True
+    def _graphics(self, controls, data):
+        action = controls.get("a", "t")
+        image_id = controls.get("i")
+        if action == "q":
+            return
+        if action == "d":
+            what = controls.get("d", "a")
+            if what in ("a", "A"):
+                self.delete_images(forget=what == "A")
+            elif what in ("i", "I"):
+                self.delete_images(image_id, forget=what == "I")
+            return
+        if action in ("t", "T"):
+            key, texture = self.images.get(controls, data, self.max_image_bytes)
+            if image_id is not None:
+                self._forget_image(image_id)
+                self._image_ids[image_id] = key
+                if action == "T":
+                    self.images.use(key)
+            elif action == "t":
+                # Nothing can show it without an id, don't keep it in use
+                self.images.release(key)
+                return
+        elif action == "p":
+            if image_id not in self._image_ids:
+                raise GraphicsError("ENOENT:no image with that id")
+            key = self._image_ids[image_id]
+            texture = self.images.textures[key]
+            self.images.use(key)
+        else:
+            raise GraphicsError(f"EINVAL:unsupported action {action}")
+        if action in ("T", "p"):
+            self._place(key, texture, image_id, controls)
+
+    def _place(self, key, texture, image_id, controls):
+        """Show an image at the cursor, scaled to c columns and r rows if given."""
+        w = self.text_size.x
+        h = self.text_size.y
+        width, height = texture.width, texture.height
+        columns, rows = controls.get("c"), controls.get("r")
+        # If only one is given, keep the aspect ratio
+        if columns and rows:
+            width, height = columns * w, rows * h
+        elif columns:
+            width, height = columns * w, height * columns * w / width
+        elif rows:
+            width, height = width * rows * h / height, rows * h
+        x = self.cursor.x
+        self.placements.append(
+            Placement(key, texture, image_id, x, self.cursor.y, width, height)
+        )
+        # Leave the cursor after the image, on its last row
+        if controls.get("C", 0) != 1:
+            for _ in range(math.ceil(height / h) - 1):
+                self.index()
+            self.cursor.x = min(x + math.ceil(width / w), self.columns - 1)
 
-            # This is using SGR mouse codes, which work on some apps and not in others
-            self.p_out.write(b"\x1b" + f"[<0;{str(x)};{str(y)}M".encode("utf-8"))
-            # This is "typical" (seems broken)
-            # self.p_out.write(b"\x1b" + f"M{chr(32)}{chr(x)}{chr(y)}".encode("utf-8"))
+    def _forget_image(self, image_id):
+        key = self._image_ids.pop(image_id, None)
+        if key is not None:
+            self.images.release(key)
 
-        elif self.mouse_pressed and not rl.is_mouse_button_pressed(
-            rl.MOUSE_LEFT_BUTTON
-        ):
-            self.mouse_pressed = False
-            # This is using SGR mouse codes, which work on some apps and not in others
-            self.p_out.write(b"\x1b" + f"[<0;{str(x)};{str(y)}m".encode("utf-8"))
-            # This is "typical" (seems broken)
-            # self.p_out.write(b"\x1b" + f"M{chr(35)}{chr(x)}{chr(y)}".encode("utf-8"))
+    def delete_images(self, image_id=None, forget=False):
+        """Stop showing inline images, all of them or the ones with image_id.
+
+        :forget: also forget the images by id, so they can't be shown again.
+        """
+        kept = []
+        for placement in self.placements:
+            if image_id is None or placement.image_id == image_id:
+                self.images.release(placement.key)
+            else:
+                kept.append(placement)
+        self.placements = kept
+        if forget:
+            for i in [image_id] if image_id is not None else list(self._image_ids):
+                self._forget_image(i)
+
+    def _move_images(self, top, bottom, n):
+        """Move images starting in rows top to bottom up n rows, like the text there.
+
+        Images that scroll off the screen are kept while they are in the
+        history, but those scrolling out of a smaller region are lost.
+        """
+        if not self.placements:
+            return
+        h = self.text_size.y
+        # Rows images can be on and still be visible somewhere
+        first = -len(self.history) if top == 0 else top
+        kept = []
+        for placement in self.placements:
+            if placement.y <= bottom and (placement.y >= top or top == 0):
+                placement.y -= n
+            if placement.y > bottom or placement.y + placement.height / h <= first:
+                self.images.release(placement.key)
+            else:
+                kept.append(placement)
+        self.placements = kept
+
+    def _draw_images(self):
+        w = self.text_size.x
+        h = self.text_size.y
+        for placement in self.placements:
+            y = (placement.y + self.view_offset) * h
+            if y >= self._screen.height or y + placement.height <= 0:
+                continue
+            texture = placement.texture
+            rl.draw_texture_pro(
+                texture,
+                (0, 0, texture.width, texture.height),
+                (placement.x * w, y, placement.width, placement.height),
+                (0, 0),
+                0,
+                rl.WHITE,
+            )
 
     def key_event(
         self,
@@ -156,21 +746,64 @@ class Terminal(pyte.HistoryScreen, rl.Layer):
                 letter = self.keymap[action][2]
             else:
                 letter = self.keymap[action][0]
-        self.p_out.write(letter)
 
-    def draw_cell(self, x, y):
-        char = self.buffer[y][x]
-        if char.fg == "default":
-            fg = rl.RAYWHITE
-        else:
-            fg = _colors.get(char.fg, None) or parse_color(char.fg)
-        if char.bg == "default":
-            bg = rl.BLACK
+        if letter == _SHIFT_PGUP:
+            self.prev_page()
+            return
+        elif letter == _SHIFT_PGDN:
+            self.next_page()
+            return
+        elif letter == _SHIFT_INSERT:
+            clipboard = rl.get_clipboard_text()
+            if clipboard != ffi.NULL:
+                self.paste(ffi.string(clipboard).decode("utf-8", "replace"))
+            return
+        elif self.view_offset:
+            self.scroll_view(-self.view_offset)
+        self.send(letter)
+
+    def set_cursor_style(self, style=0, *args, **kwargs):
+        """Set the cursor style (DECSCUSR), 0 is back to the default."""
+        if style in _CURSOR_STYLES:
+            self.cursor_shape, self.cursor_blink = _CURSOR_STYLES[style]
         else:
-            bg = _colors.get(char.bg, None) or parse_color(char.bg)
+            self.__dict__.pop("cursor_shape", None)
+            self.__dict__.pop("cursor_blink", None)
 
-        if char.reverse:
-            fg, bg = bg, fg
+    def draw_overlay(self):
+        """Draw inline images and the cursor, over the text.
+
+        They are not part of the layer texture, so moving the cursor or
+        making it blink doesn't mean drawing anything there, and text
+        drawn under an image doesn't mean drawing the image again.
+        """
+        self._draw_images()
+        cursor = self.cursor
+        if (
+            cursor.hidden
+            or self.view_offset  # Looking at the history
+            or not (0 <= cursor.x < self.columns and 0 <= cursor.y < self.lines)
+        ):
+            return
+        if self.cursor_blink and int(rl.get_time() / self.cursor_blink_rate) % 2:
+            return
+        w = int(self.text_size.x)
+        h = int(self.text_size.y)
+        x = int(cursor.x * self.text_size.x)
+        y = int(cursor.y * self.text_size.y)
+        thickness = max(2, h // 12)
+        if self.cursor_shape == "underline":
+            y += h - thickness
+            h = thickness
+        elif self.cursor_shape == "bar":
+            w = thickness
+        rl.draw_rectangle(x, y, w, h, _CURSOR_COLOR)
+
+    def draw_cell(self, x, y, char=None):
+        """Draw cell x of row y. char is what's in it, if the caller has it."""
+        if char is None:
+            char = self.visible_line(y)[x]
+        fg, bg = self.colors.resolve(char)
 
         rl.draw_rectangle(
             int(x * self.text_size.x),
@@ -179,43 +812,208 @@ class Terminal(pyte.HistoryScreen, rl.Layer):
             int(self.text_size.y),
             bg,
         )
-        rl.draw_text_ex(
-            self.font,
-            char.data.encode("utf-8"),
-            (x * self.text_size.x, y * self.text_size.y),
-            self.font.baseSize,
-            0,
-            fg,
+        self.glyphs.draw_text(
+            char.data, (x * self.text_size.x, y * self.text_size.y), fg
         )
-        if (x, y) == (self.cursor.x, self.cursor.y):
-            self.last_cursor = (x, y)
+
+    def row_runs(self, y, start=0, end=None, line=None):
+        """Split cells [start, end) of row y into runs that can be drawn together.
+
+        A run is a sequence of consecutive cells with the same colors.
+        Cells holding more than one codepoint (combining characters)
+        are always a run of their own so they don't shift the rest
+        of the text.
+
+        Yields (start, end, char, text) where char is the first cell
+        of the run and text is what should be drawn for it.
+
+        :line: the row's visible_line, if the caller already has it.
+        """
+        if line is None:
+            line = self.visible_line(y)
+        if end is None:
+            end = self.columns
+        run_start = start
+        run_key = None
+        text = []
+        for x in range(start, end):
+            char = line[x]
+            data = char.data or " "  # "" is the stub after a wide character
+            key = (char.fg, char.bg, char.reverse)
+            if key != run_key or len(data) != 1:
+                if text:
+                    yield run_start, x, line[run_start], "".join(text)
+                run_start = x
+                run_key = key if len(data) == 1 else None
+                text = []
+            text.append(data)
+        if text:
+            yield run_start, end, line[run_start], "".join(text)
+
+    def draw_row(self, y, start=0, end=None, line=None):
+        """Draw cells [start, end) of row y.
+
+        Uses one rectangle and one text call per run of cells sharing
+        colors, instead of two calls per cell like draw_cell.
+
+        :line: see row_runs.
+        """
+        if end is None:
+            end = self.columns
+        w = self.text_size.x
+        h = self.text_size.y
+        for run_start, run_end, char, text in self.row_runs(y, start, end, line):
+            fg, bg = self.colors.resolve(char)
             rl.draw_rectangle(
-                int(self.cursor.x * self.text_size.x),
-                int(self.cursor.y * self.text_size.y),
-                int(self.text_size.x),
-                int(self.text_size.y),
-                (255, 255, 255, 100),
+                int(run_start * w),
+                int(y * h),
+                int((run_end - run_start) * w),
+                int(h),
+                bg,
             )
+            text = text.rstrip()
+            if text:
+                self.glyphs.draw_text(text, (run_start * w, y * h), fg)
+
+    def feed_pending(self, budget=None):
+        """Feed pyte output the program already wrote, for up to budget seconds.
+
+        :budget: time limit, defaults to feed_budget.
+        """
+        if budget is None:
+            budget = self.feed_budget
+        reader = self.reader
+        deadline = time.perf_counter() + budget
+        while True:
+            chunk = reader.peek(self.feed_chunk)
+            if not chunk:
+                break
+            self.stream.feed(chunk)
+            reader.consume(len(chunk))
+            if time.perf_counter() >= deadline:
+                break
+
+    def pending(self):
+        """Shown, or hidden with output to parse or input to send."""
+        return (
+            self.enabled or bool(self._input) or bool(self.reader and len(self.reader))
+        )
 
     def update(self):
-        self.mouse_event()
-
-        # Honestly, this could go in a thread and block on select, but who cares
-        ready, _, _ = select.select([self.p_out], [], [], 0)
-        if ready:
-            try:
-                data = self.p_out.read(65535)
-                if data:
-                    self.stream.feed(data)
-            except OSError:  # Program went away
-                return
-        rl.begin_texture_mode(self.texture)
+        if self.enabled:
+            self.mouse_event()
+        if self.reader is not None:
+            if self.view_offset and len(self.reader):
+                self.scroll_view(-self.view_offset)
+            self.feed_pending()
+        self.flush_input()
+        if self.enabled:  # Otherwise it's drawn when shown again
+            self.render()
+            self._check_overlay()
+
+    def _check_overlay(self):
+        """Mark the layer damaged if what draw_overlay draws changed."""
+        cursor = self.cursor
+        state = (
+            cursor.x,
+            cursor.y,
+            cursor.hidden,
+            self.cursor_shape,
+            self.cursor_blink and int(rl.get_time() / self.cursor_blink_rate) % 2,
+            self.view_offset,
+            [(p.key, p.x, p.y) for p in self.placements],
+        )
+        if state != self._overlay:
+            self._overlay = state
+            self.damaged = True
+
+    def invalidate(self):
+        """Forget what was drawn, so the next render draws every cell."""
+        self._shadow = [[None] * self.columns for _ in range(self.lines)]
+        self.dirty.update(range(self.lines))
+        self._scrolls.clear()
+
+    def _render_row(self, y):
+        """Draw the cells in row y that differ from what was last drawn there.
 
-        self.draw_cell(*self.last_cursor)
-        self.draw_cell(self.cursor.x, self.cursor.y)
+        Returns the number of cells drawn.
+        """
+        columns = self.columns
+        line = self.visible_line(y)
+        shadow = self._shadow[y]
+        current = [line[x] for x in range(columns)]  # Can't enumerate, it's sparse
+        if current == shadow:
+            return 0
+
+        drawn = 0
+        start = None
+        for x in range(columns + 1):
+            if x < columns and current[x] != shadow[x]:
+                if start is None:
+                    start = x
+            elif start is not None:
+                if self.coalesce_runs:
+                    self.draw_row(y, start, x, line)
+                else:
+                    for cx in range(start, x):
+                        self.draw_cell(cx, y, current[cx])
+                drawn += x - start
+                start = None
+        self._shadow[y] = current
+        return drawn
+
+    def render(self):
+        """Draw whatever changed since the last call into the layer texture.
+
+        Pyte only tells us which rows changed, so each dirty row is compared
+        against a shadow copy of what was last drawn, and only cells that
+        actually differ are drawn. How many cells were compared and drawn
+        is left in cells_examined and cells_drawn.
+
+        When nothing changed, the texture is not touched at all.
+        """
+        if self.use_shader:
+            self._render_cells()
+            return
+
+        if self._scrolls:
+            self.damaged = True
+        for scroll in self._scrolls:
+            self._blit_scroll(*scroll)
+        self._scrolls.clear()
+
+        self.cells_examined = 0
+        self.cells_drawn = 0
+        if not self.dirty:
+            return
+
+        rl.begin_texture_mode(self.texture)
         for y in self.dirty:
-            for x in range(self.columns):  # Can't enumerate, it's sparse
-                self.draw_cell(x, y)
+            if 0 <= y < self.lines:
+                self.cells_examined += self.columns
+                self.cells_drawn += self._render_row(y)
         self.dirty.clear()
-
         rl.end_texture_mode()
+        if self.cells_drawn:
+            self.damaged = True
+
+    def _render_cells(self):
+        """Like render, but with CellGrid: pack the rows that changed, draw them all."""
+        rows = {y for y in self.dirty if 0 <= y < self.lines}
+        # Scrolled rows moved in the grid too
+        for top, bottom, n in self._scrolls:
+            rows.update(range(top, bottom + 1))
+        self._scrolls.clear()
+        self.dirty.clear()
+        # Something else using the atlas moved glyphs this one shows
+        if self._cells is not None and self._cells.stale:
+            rows.update(range(self.lines))
+
+        self.cells_examined = self.cells_drawn = len(rows) * self.columns
+        if not rows:
+            return
+        if self._cells is None:
+            self._cells = CellGrid(self)
+        self._cells.update(sorted(rows))
+        self._cells.draw(self.texture)
+        self.damaged = True
@@ -0,0 +1,457 @@
+"""A Terminal that parses its program's output in another process.
+
+Parsing with pyte is most of the work a busy terminal does, and in
+Terminal it happens in the same thread as drawing everything else, so
+one terminal running something noisy slows down every layer. A
+WorkerTerminal instead has a worker process read the pty and keep the
+pyte screen, and all it does itself is copy what changed and draw it.
+With several of them, parsing runs on several cores.
+
+About once a frame, the worker compares its screen with what it last
+sent and writes a diff to a ring buffer in shared memory:
+
+* the rows that changed, each as its distinct Chars plus an index per cell
+* how rows scrolled, so moved rows don't have to be sent or redrawn
+* lines that scrolled into the history
+* where the cursor is, the cursor style and the modes
+
+The terminal reads all diffs waiting in the ring each frame and applies
+them to its own copy of the screen, which it draws like Terminal does.
+If it falls behind and the ring fills up, the worker just keeps
+parsing, and what it sends when there's room is the difference with
+the latest screen, skipping whatever it showed in between.
+
+Inline images are not supported in a WorkerTerminal yet.
+"""
+
+import multiprocessing
+import os
+import pickle
+import select
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+from multiprocessing import shared_memory
+
+import pyte
+from pyte.screens import StaticDefaultDict
+
+from cobra_py import rl
+from cobra_py.fast_screen import FastScreen
+from cobra_py.pty_writer import PtyWriter
+from cobra_py.terminal import Terminal, TerminalStream
+
+# The worker shares the pty with us, so it has to be forked
+_context = multiprocessing.get_context("fork")
+
+
+class DiffRing:
+    """A ring buffer of messages in shared memory, with one writer and one reader.
+
+    Starts with how many bytes were ever written and read, the rest is
+    the ring. Each message is its length and then its bytes.
+    """
+
+    _POSITION = struct.Struct("Q")
+    _LENGTH = struct.Struct("I")
+
+    def __init__(self, size):
+        self.size = size
+        header = 2 * self._POSITION.size
+        self.memory = shared_memory.SharedMemory(create=True, size=header + size)
+        self._data = self.memory.buf[header:]
+        self._POSITION.pack_into(self.memory.buf, 0, 0)
+        self._POSITION.pack_into(self.memory.buf, self._POSITION.size, 0)
+        # Reading and writing the positions under a lock keeps the other
+        # side from seeing them before the data they point to.
+        self._lock = _context.Lock()
+
+    def _get_position(self, which):
+        with self._lock:
+            return self._POSITION.unpack_from(
+                self.memory.buf, which * self._POSITION.size
+            )[0]
+
+    def _set_position(self, which, value):
+        with self._lock:
+            self._POSITION.pack_into(
+                self.memory.buf, which * self._POSITION.size, value
+            )
+
+    def _write(self, position, data):
+        start = position % self.size
+        first = min(len(data), self.size - start)
+        self._data[slice(start, start + first)] = data[:first]
+        self._data[: len(data) - first] = data[first:]
+
+    def _read(self, position, count):
+        start = position % self.size
+        first = min(count, self.size - start)
+        return bytes(self._data[slice(start, start + first)]) + bytes(
+            self._data[: count - first]
+        )
+
+    def __len__(self):
+        """How many bytes are waiting to be read."""
+        return self._get_position(0) - self._get_position(1)
+
+    def put(self, message: bytes) -> bool:
+        """Add a message, returns False if there is no room for it."""
+        record = self._LENGTH.pack(len(message)) + message
+        written = self._get_position(0)
+        if self.size - (written - self._get_position(1)) < len(record):
+            return False
+        self._write(written, record)
+        self._set_position(0, written + len(record))
+        return True
+
+    def get(self):
+        """Return all the messages waiting, oldest first."""
+        written = self._get_position(0)
+        read = self._get_position(1)
+        messages = []
+        while read < written:
+            length = self._LENGTH.unpack(self._read(read, self._LENGTH.size))[0]
+            read += self._LENGTH.size
+            messages.append(self._read(read, length))
+            read += length
+        self._set_position(1, read)
+        return messages
+
+    def close(self, unlink=False):
+        self._data.release()
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def _encode(line, columns):
+    """A row as (distinct Chars, index of each cell's Char in them)."""
+    chars = {}
+    indexes = array(
+        "H", [chars.setdefault(line[x], len(chars)) for x in range(columns)]
+    )
+    return tuple(chars), indexes
+
+
+class _WorkerScreen(FastScreen):
+    """The worker's screen, keeping track of what it has to send.
+
+    sent is what the other side has in each row, as of the last diff,
+    None if it has to be sent no matter what.
+    """
+
+    # Most lines to keep for the history while the other side is behind
+    history_backlog = 10000
+
+    def __init__(self, columns, lines):
+        # pyte calls reset while setting up
+        self._scrolls = []
+        self._history = deque(maxlen=self.history_backlog)
+        super().__init__(columns, lines)
+        self._clear_history = False
+        self.sent = [None] * self.lines
+
+    def resize(self, lines=None, columns=None):
+        super().resize(lines, columns)
+        self._scrolls.clear()
+        self.sent = [None] * self.lines
+
+    def _scroll(self, top, bottom, n):
+        """Like Terminal._scroll, for sent instead of a shadow buffer."""
+        end = bottom + 1
+        height = end - top
+        blank = [None] * min(abs(n), height)
+        if n > 0:
+            kept = top + n
+            self.sent[top:end] = self.sent[kept:end] + blank
+        else:
+            kept = end + n
+            self.sent[top:end] = blank + self.sent[top:kept]
+        if self._scrolls and self._scrolls[-1][:2] == (top, bottom):
+            pending = self._scrolls[-1][2]
+            if (pending > 0) == (n > 0):
+                n += pending
+                self._scrolls.pop()
+        if abs(n) < height:
+            self._scrolls.append((top, bottom, n))
+
+    def index(self):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == bottom:
+            if top == 0:
+                self._history.append(_encode(self.buffer[top], self.columns))
+            self._scroll(top, bottom, 1)
+        super().index()
+
+    def reverse_index(self):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == top:
+            self._scroll(top, bottom, -1)
+        super().reverse_index()
+
+    def insert_lines(self, count=None):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if top <= self.cursor.y <= bottom:
+            self._scroll(self.cursor.y, bottom, -(count or 1))
+        super().insert_lines(count)
+
+    def delete_lines(self, count=None):
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if top <= self.cursor.y <= bottom:
+            self._scroll(self.cursor.y, bottom, count or 1)
+        super().delete_lines(count)
+
+    def reset(self):
+        super().reset()
+        self.cursor_style = 0
+        self._clear_history = True
+        self._history.clear()
+
+    def erase_in_display(self, how=0, *args, **kwargs):
+        super().erase_in_display(how, *args, **kwargs)
+        if how == 3:
+            self._clear_history = True
+            self._history.clear()
+
+    def set_cursor_style(self, style=0, *args, **kwargs):
+        self.cursor_style = style
+
+    def graphics_command(self, payload):
+        pass
+
+    def diff(self):
+        """Return (message, rows) with what changed since the last diff, if anything.
+
+        Nothing is considered sent until it's passed to commit.
+        """
+        columns = self.columns
+        rows = {}
+        for y in range(self.lines):
+            if y in self.dirty or self.sent[y] is None:
+                line = self.buffer[y]
+                current = [line[x] for x in range(columns)]
+                if current != self.sent[y]:
+                    rows[y] = current
+        message = dict(
+            size=(self.lines, columns),
+            rows={y: _encode(row, columns) for y, row in rows.items()},
+            scrolls=self._scrolls,
+            history=list(self._history),
+            clear_history=self._clear_history,
+            cursor=(self.cursor.x, self.cursor.y, self.cursor.hidden),
+            cursor_style=self.cursor_style,
+            mode=self.mode,
+        )
+        return message, rows
+
+    def commit(self, rows):
+        """Mark the diff that returned rows as sent."""
+        for y, row in rows.items():
+            self.sent[y] = row
+        self.dirty.clear()
+        self._scrolls = []
+        self._history.clear()
+        self._clear_history = False
+
+
+def _work(fd, columns, lines, ring, control, frame_time, wake):
+    """The worker process: parse what comes from fd, send diffs through ring.
+
+    A byte is written to the wake fd after each diff, see _wake_screen.
+    """
+    screen = _WorkerScreen(columns, lines)
+    stream = TerminalStream(screen)
+    last_state = None  # (cursor, cursor style, mode) last sent
+    last_sent = 0
+    pending = False  # Whether something happened since the last diff
+    eof = False
+    while not eof or pending:
+        timeout = None
+        if pending:
+            timeout = max(0, last_sent + frame_time - time.perf_counter())
+        ready, _, _ = select.select(
+            [control] if eof else [fd, control], [], [], timeout
+        )
+        if control in ready:
+            command = control.recv()
+            if command is None:
+                return
+            screen.resize(*command)
+            pending = True
+        if fd in ready:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:  # Program went away
+                data = b""
+            eof = not data
+            stream.feed(data)
+            pending = True
+        if not pending or time.perf_counter() - last_sent < frame_time:
+            continue
+
+        last_sent = time.perf_counter()
+        message, rows = screen.diff()
+        state = (message["cursor"], message["cursor_style"], set(message["mode"]))
+        if (
+            rows
+            or message["scrolls"]
+            or message["history"]
+            or message["clear_history"]
+            or state != last_state
+        ):
+            data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+            if not ring.put(data):
+                if len(data) > ring.size // 2:
+                    # Too much history piled up, it's never going to fit
+                    screen._history.clear()
+                continue  # Try again in a frame
+            try:
+                os.write(wake, b"\0")
+            except BlockingIOError:  # Plenty of wake ups pending already
+                pass
+        screen.commit(rows)
+        last_state = state
+        pending = False
+
+
+def _wake_screen(fd):
+    """End the Screen's wait whenever the worker sends a diff, until it exits.
+
+    The worker can't do it itself, raylib lives in this process.
+    """
+    while os.read(fd, 4096):
+        rl.wake_up()
+    os.close(fd)
+
+
+class WorkerTerminal(Terminal):
+    """A Terminal whose program output is parsed in a worker process.
+
+    Use it instead of Terminal, everything else works the same. See
+    the module docstring for how.
+    """
+
+    # Bytes of shared memory for diffs on their way
+    ring_size = 8 << 20
+    # How often the worker sends a diff, at most
+    frame_time = 1 / 60
+
+    worker = None
+
+    def _start_io(self, fd):
+        self.ring = DiffRing(self.ring_size)
+        self._control, worker_control = _context.Pipe()
+        wake_read, wake_write = os.pipe()
+        os.set_blocking(wake_write, False)
+        self.worker = _context.Process(
+            target=_work,
+            args=(
+                fd,
+                self.columns,
+                self.lines,
+                self.ring,
+                worker_control,
+                self.frame_time,
+                wake_write,
+            ),
+            daemon=True,
+        )
+        self.worker.start()
+        os.close(wake_write)
+        threading.Thread(target=_wake_screen, args=(wake_read,), daemon=True).start()
+        self.writer = PtyWriter(fd)
+        self.writer.start()
+
+    def close(self):
+        """Stop the worker and free the shared memory.
+
+        Called by update once the program exited and everything it wrote
+        is shown, and by Screen.run when the window closes.
+        """
+        if self.worker is None:
+            return
+        try:
+            self._control.send(None)
+        except OSError:  # It's gone already, the program exited
+            pass
+        self.worker.join(1)
+        if self.worker.is_alive():
+            self.worker.terminate()
+        self.worker = None
+        self._control.close()
+        self.ring.close(unlink=True)
+
+    def resize(self, lines=None, columns=None):
+        super().resize(lines, columns)
+        if self.worker is not None:
+            try:
+                self._control.send((self.lines, self.columns))
+            except OSError:  # The program exited, there's nothing to resize
+                pass
+
+    def pending(self):
+        return (
+            self.enabled
+            or bool(self._input)
+            or bool(self.worker is not None and len(self.ring))
+        )
+
+    def update(self):
+        if self.enabled:
+            self.mouse_event()
+        if self.worker is not None:
+            messages = self.ring.get()
+            if messages and self.view_offset:
+                self.scroll_view(-self.view_offset)
+            for message in messages:
+                self.apply(pickle.loads(message))
+            # Alive first: it may send one last diff before exiting
+            if not self.worker.is_alive() and not len(self.ring):
+                self.close()
+        self.flush_input()
+        if self.enabled:
+            self.render()
+            self._check_overlay()
+
+    def _decode(self, encoded):
+        chars, indexes = encoded
+        line = StaticDefaultDict(self.default_char)
+        line.update(enumerate(chars[i] for i in indexes[: self.columns]))
+        return line
+
+    def apply(self, message):
+        """Apply a diff from the worker to the screen."""
+        if message["clear_history"]:
+            self.history.clear()
+            self.view_offset = 0
+        for encoded in message["history"]:
+            self.history.push(self._decode(encoded), self.columns)
+        self.mode = set(message["mode"])
+        self._update_mouse_mode()
+        self.set_cursor_style(message["cursor_style"])
+        if message["size"] != (self.lines, self.columns):
+            return  # Sent before a resize, a full one is coming
+        self.cursor.x, self.cursor.y, self.cursor.hidden = message["cursor"]
+        for top, bottom, n in message["scrolls"]:
+            self._move_rows(top, bottom, n)
+        for y, encoded in message["rows"].items():
+            self.buffer[y] = self._decode(encoded)
+            self.dirty.add(y)
+
+    def _move_rows(self, top, bottom, n):
+        """Scroll rows top to bottom up n rows (down if n < 0), like the worker did."""
+        end = bottom + 1
+        rows = [self.buffer[y] for y in range(top, end)]
+        blank = [
+            StaticDefaultDict(self.default_char) for _ in range(min(abs(n), len(rows)))
+        ]
+        if n > 0:
+            rows = rows[n:] + blank
+        else:
+            rows = blank + rows[: len(rows) + n]
+        for y, row in zip(range(top, end), rows):
+            self.buffer[y] = row
+        self._scroll(top, bottom, n)
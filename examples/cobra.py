@@ -3,6 +3,7 @@
 from multiprocessing import Process
 
 from cobra_py.graphics_server import Server
+from cobra_py.profiler_layer import ProfilerLayer
 from cobra_py.rl import Screen
 from cobra_py.terminal import Terminal
 
@@ -13,6 +14,8 @@ class Cobrapy(Screen):
         self.term = Terminal(self, cmd="sweepleg", enabled=False)
         self.graphics = Server(self, enabled=False)
         self.editor = Terminal(self, cmd="micro foo.py", enabled=False)
+        # Last, so it's on top, and always shown
+        self.stats = ProfilerLayer(self)
         self.child = None
         self.show_prompt()
 
@@ -68,9 +71,13 @@ while True:
 
         super().key_event(key, scancode, action, mods)
 
-    def show_prompt(self):
+    def hide_all(self):
         for layer in self.layers:
-            layer.enabled = False
+            if layer is not self.stats:
+                layer.enabled = False
+
+    def show_prompt(self):
+        self.hide_all()
         self.term.enabled = True
         self.graphics.enabled = True
         if self.child:
@@ -78,16 +85,14 @@ while True:
             self.child = None
 
     def show_editor(self):
-        for layer in self.layers:
-            layer.enabled = False
+        self.hide_all()
         self.editor.enabled = True
         if self.child:
             self.child.kill()
             self.child = None
 
     def show_graphics(self):
-        for layer in self.layers:
-            layer.enabled = False
+        self.hide_all()
         self.graphics.enabled = True
         self.run_program()
 
@@ -7,15 +7,13 @@ from cobra_py.raylib import ffi
 sw = 800
 sh = 450
 
-rl.init_window(sw, sh, b"Raylib Fonts")
+rl.init_window(sw, sh, "Raylib Fonts")
 
-font_path = str(Path(rl.__file__).parent / "resources" / "fonts" / "monoid.ttf").encode(
-    "utf-8"
-)
-kepler_font = rl.LoadFontEx(font_path, 48, ffi.NULL, 0)
+font_path = str(Path(rl.__file__).parent / "resources" / "fonts" / "monoid.ttf")
+kepler_font = rl.load_font_ex(font_path, 48, ffi.NULL, 0)
 
-message = b"This is the Monoid Font"
-text_size = rl.MeasureTextEx(kepler_font, message, kepler_font.baseSize, 0)
+message = "This is the Monoid Font"
+text_size = rl.measure_text_ex(kepler_font, message, kepler_font.baseSize, 0)
 
 while not rl.window_should_close():
     rl.begin_drawing()
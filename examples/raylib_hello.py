@@ -5,13 +5,13 @@ sw = 800
 sh = 450
 
 # Same as the raylib example, just using snake_case instead of CamelCase for functions
-rl.init_window(sw, sh, b"Example")
+rl.init_window(sw, sh, "Example")
 rl.set_target_fps(60)
 while not rl.window_should_close():
     rl.begin_drawing()
     rl.clear_background(rl.RAYWHITE)
     rl.draw_text(
-        b"Congrats! You created your first window!",
+        "Congrats! You created your first window!",
         190,
         200,
         20,
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 
+from cobra_py.profiler_layer import ProfilerLayer
 from cobra_py.rl import Screen
 from cobra_py.terminal import Terminal
 
 screen = Screen(800, 600)
 term = Terminal(screen, cmd="bash")
+ProfilerLayer(screen)
 screen.run()
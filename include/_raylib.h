@@ -1644,3 +1644,6 @@ void GuiClearIconPixel(int iconId, int x, int y);     // Clear icon pixel value
 bool GuiCheckIconPixel(int iconId, int x, int y);     // Check icon pixel value
 
 void SetKeyCallback(void(*f)(int, int, int, int));
+void WaitEvents(double timeout);                           // Poll input without drawing, then wait up to timeout seconds for more
+void WakeUp(void);                                         // Make WaitEvents return, from any thread
+void rlglDraw(void);                                       // Draw everything batched so far (from rlgl.h)
@@ -1,5 +1,7 @@
 import os
 import pathlib
+import re
+from types import BuiltinFunctionType
 
 import cffi
 from invoke import task
@@ -65,6 +67,8 @@ def bind_raylib(c):
             #define RAYGUI_SUPPORT_ICONS
             #include "raylib.h"
             #include "raygui.h"
+            // Part of raylib, but only declared in rlgl.h
+            void rlglDraw(void);
         """,
         libraries=libraries,
         library_dirs=library_dirs,
@@ -72,3 +76,71 @@ def bind_raylib(c):
         include_dirs=[includes, lib_dir],
     )
     ffi.compile()
+    rl_names(c)
+
+
+# A function declaration in _raylib.h, like
+# void DrawText(const char *text, int posX, int posY, int fontSize, Color color);
+_DECLARATION = re.compile(r"^[\w *]*?\b(\w+)\(([^)]*)\);", re.M)
+_STRING_PARAM = re.compile(r"\s*const char \*\s*\w+\s*$")
+
+
+def string_args(header):
+    """Map function names to the positions of their const char * parameters"""
+    result = {}
+    for name, params in _DECLARATION.findall(header):
+        positions = tuple(
+            i for i, param in enumerate(params.split(",")) if _STRING_PARAM.match(param)
+        )
+        if positions:
+            result[name] = positions
+    return result
+
+
+@task
+def rl_names(c):
+    """Write the tables of raylib names and string arguments cobra_py.rl uses"""
+    from cobra_py.raylib import lib
+    from cobra_py.rl import camel_to_snake
+
+    functions = [
+        name for name in dir(lib) if isinstance(getattr(lib, name), BuiltinFunctionType)
+    ]
+    with open(includes / "_raylib.h") as inf:
+        strings = string_args(inf.read())
+    with open("cobra_py/rl_names.py", "w") as outf:
+        outf.write('"""Generated by invoke rl_names, don\'t edit."""\n\n')
+        outf.write("# snake_case name -> raylib name\n")
+        outf.write("NAMES = {\n")
+        for snake, name in sorted((camel_to_snake(name), name) for name in functions):
+            outf.write(f'    "{snake}": "{name}",\n')
+        outf.write("}\n\n")
+        outf.write("# raylib name -> positions of its const char * arguments\n")
+        outf.write("STRING_ARGS = {\n")
+        for name in sorted(set(functions) & set(strings)):
+            outf.write(f'    "{name}": {strings[name]!r},\n')
+        outf.write("}\n")
+
+
+@task
+def bench(c):
+    """Replay the recorded traces through Terminal, see benchmarks/suite.py"""
+    c.run("python benchmarks/suite.py --json bench_output.json")
+
+
+@task
+def idle_cpu(c):
+    """Compare CPU use of an idle Screen, with and without frame skipping"""
+    c.run("python benchmarks/idle_cpu.py")
+
+
+@task
+def import_time(c):
+    """Check importing cobra_py.rl stays within its time budget"""
+    c.run("python benchmarks/import_time.py")
+
+
+@task
+def glyph_table(c):
+    """Rasterize the glyph table cobra_py.headless uses from the bundled font"""
+    c.run("python -m cobra_py.headless")